@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import importlib.util
 import os
 
 from pathlib import Path
@@ -131,7 +132,11 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATICFILES_DIRS = [
+    os.path.join(BASE_DIR, 'static'),
+    # plotly.js from the installed plotly package, served as plotly/plotly.min.js
+    ('plotly', os.path.join(importlib.util.find_spec('plotly').submodule_search_locations[0], 'package_data')),
+]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -144,4 +149,57 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 LOGIN_REDIRECT_URL = '/project/'
-LOGOUT_REDIRECT_URL = '/project/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/project/'
+
+# mini_fb news feed. When MINI_FB_FEED_FANOUT is on, new statuses are pushed into a
+# bounded timeline per friend at write time. Authors with more than
+# MINI_FB_FANOUT_MAX_FRIENDS friends are skipped and read at request time instead.
+MINI_FB_FEED_FANOUT = False
+MINI_FB_TIMELINE_LENGTH = 500
+MINI_FB_FANOUT_MAX_FRIENDS = 1000
+
+# Number of status messages per page on the profile page and news feed
+MINI_FB_PAGE_SIZE = 20
+
+# Number of ranked friend suggestions shown to a profile
+MINI_FB_SUGGESTIONS_LIMIT = 10
+
+# Status image variants, generated by MINI_FB_IMAGE_WORKERS background threads (0 = inline)
+MINI_FB_IMAGE_WORKERS = 2
+MINI_FB_THUMBNAIL_SIZE = (200, 200)
+MINI_FB_WEB_IMAGE_SIZE = (1280, 1280)
+MINI_FB_IMAGE_QUALITY = 85
+
+# Chunked status image uploads: the largest file, the largest chunk per request,
+# and how long an unfinished upload is kept (see clear_stale_uploads)
+MINI_FB_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+MINI_FB_UPLOAD_CHUNK_SIZE = 2 * 1024 * 1024
+MINI_FB_UPLOAD_EXPIRY_HOURS = 24
+
+# Lifetime of cached profile page fragments. Changes invalidate them through Profile.cache_version.
+MINI_FB_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Live news feed over server-sent events. Needs an ASGI server (cs412.asgi):
+# under WSGI (the Procfile's gunicorn cs412.wsgi) each stream would hold a worker forever.
+MINI_FB_LIVE_FEED = False
+
+# Broker that carries live news feed updates to connected viewers
+MINI_FB_LIVE_BROKER = 'mini_fb.live.LocalBroker'
+
+# How long voter_analytics caches values derived from the voter data, such as the
+# party filter choices. The cache keys include the voter data version, which is
+# stored in the database, so a load is seen by every process as soon as it commits.
+VOTER_CHOICES_CACHE_TIMEOUT = 60 * 15
+
+# How long the voter graphs' figure JSON is cached per filter and data version.
+VOTER_CHART_CACHE_TIMEOUT = 60 * 60
+
+# Filter the voter list in an in-memory NumPy column store instead of SQL.
+# Needs numpy installed; each process holds a copy of the filterable columns.
+VOTER_COLUMNAR_SNAPSHOT = False
+
+# Voters read per database round trip (and per Parquet row group) by the voter export
+VOTER_EXPORT_CHUNK_SIZE = 2000
+
+# Voters per page of the voter list
+VOTER_PAGE_SIZE = 100
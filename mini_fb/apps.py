@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MiniFbConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mini_fb'
+
+    def ready(self):
+        # Connects the model signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,163 @@
+''' Query-count and latency benchmarks for the mini_fb views.
+
+seed_graph() builds a synthetic social graph of a given shape and
+run_benchmarks() drives the main views through the Django test client,
+recording SQL query count, p50/p95 latency and peak Python memory per view.
+Each view is measured cold (caches cleared before every request) and warm
+(caches left in place). Reports are plain dicts that serialize to JSON, and
+find_regressions() compares a report with a saved baseline.
+
+The suite runs from mini_fb/tests.py (ViewBenchmarkTests) when MINI_FB_BENCHMARKS
+is set, and is configured with MINI_FB_BENCH_* environment variables. See that
+class for details.
+'''
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Image, Profile, StatusMessage
+from .seeding import create_profiles, create_statuses, insert_edges, power_law_edges
+
+# Views measured, as (name, url factory); url factories take (viewer, other profile)
+VIEWS = [
+    ('ShowProfilePageView', lambda viewer, other: reverse('show_profile', args=[viewer.pk])),
+    ('ShowNewsFeedView', lambda viewer, other: reverse('show_news_feed')),
+    ('ShowFriendSuggestionsView', lambda viewer, other: reverse('friend_suggestions')),
+    ('CreateFriendView', lambda viewer, other: reverse('add_friend', args=[other.pk])),
+]
+
+
+def seed_graph(profiles=200, degree=5, statuses_per_profile=3, images_per_status=1, seed=0):
+    ''' Creates a power-law friend graph with statuses and images. Returns the best-connected profile, with a login. '''
+    rng = random.Random(seed)
+    profile_ids = create_profiles(profiles, rng=rng)
+    insert_edges(power_law_edges(profile_ids, degree, rng))
+    create_statuses(profile_ids, statuses_per_profile)
+    if images_per_status:
+        status_ids = StatusMessage.objects.filter(profile_id__in=profile_ids).values_list('id', flat=True)
+        Image.objects.bulk_create(
+            [Image(status_message_id=pk, image_file=f"imgs/bench_{pk}_{n}.jpg")
+             for pk in status_ids for n in range(images_per_status)],
+            batch_size=1000,
+        )
+
+    # The oldest profile has the most friends under preferential attachment
+    viewer = Profile.objects.get(pk=profile_ids[0])
+    viewer.user = User.objects.create_user(f"bench_viewer_{viewer.pk}", password='benchmark')
+    viewer.save(update_fields=['user'])
+    return viewer
+
+
+def percentile(samples, fraction):
+    ''' Nearest-rank percentile of samples '''
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def measure(client, urls, cold, trace_url=None):
+    ''' Requests each url once and returns the view's metrics.
+
+    Latency is timed without tracemalloc, which slows Python down a lot; peak
+    memory comes from one extra traced request, to trace_url if given.
+    '''
+    timings, query_counts = [], []
+    for url in urls:
+        if cold:
+            cache.clear()
+        # Like timeit, keep garbage collection pauses out of the timings
+        gc.collect()
+        gc.disable()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            gc.enable()
+        if response.status_code >= 400:
+            raise AssertionError(f"GET {url} returned {response.status_code}")
+        query_counts.append(len(queries))
+
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    client.get(trace_url or urls[-1])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'requests': len(urls),
+        'queries': max(query_counts),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(client, viewer, repeat=20):
+    ''' Measures every view in VIEWS cold and warm, and returns the report '''
+    client.force_login(viewer.user)
+    excluded = viewer.get_friend_ids() | {viewer.pk}
+    # CreateFriendView needs a new friend per request
+    strangers = list(Profile.objects.exclude(id__in=excluded).order_by('id')[:repeat * 2 + 2])
+
+    report = {'views': {}}
+    for name, url_for in VIEWS:
+        results = {}
+        for mode in ('cold', 'warm'):
+            trace_url = None
+            if name == 'CreateFriendView':
+                # A new stranger per request, plus one for the memory trace
+                batch, strangers = strangers[:repeat + 1], strangers[repeat + 1:]
+                if len(batch) < 2:
+                    continue
+                urls = [url_for(viewer, other) for other in batch[:-1]]
+                trace_url = url_for(viewer, batch[-1])
+            else:
+                urls = [url_for(viewer, None)] * repeat
+            # Untimed request so template loading and, for warm runs, cache priming are not measured
+            client.get(urls[0])
+            results[mode] = measure(client, urls, cold=(mode == 'cold'), trace_url=trace_url)
+        report['views'][name] = results
+    return report
+
+
+def find_regressions(report, baseline, latency_threshold=0.5, latency_slack_ms=2.0):
+    ''' Returns a description of each metric in report that regressed against baseline.
+
+    A view regresses when it runs more queries than in the baseline, or when its
+    p95 latency exceeds the baseline's by more than latency_threshold (a
+    fraction) and latency_slack_ms. The slack keeps timer noise on very fast
+    views from counting.
+    '''
+    regressions = []
+    for name, modes in report['views'].items():
+        for mode, metrics in modes.items():
+            before = baseline.get('views', {}).get(name, {}).get(mode)
+            if before is None:
+                continue
+            if metrics['queries'] > before['queries']:
+                regressions.append(f"{name} ({mode}): {before['queries']} -> {metrics['queries']} queries")
+            limit = max(before['p95_ms'] * (1 + latency_threshold), before['p95_ms'] + latency_slack_ms)
+            if metrics['p95_ms'] > limit:
+                regressions.append(f"{name} ({mode}): p95 {before['p95_ms']}ms -> {metrics['p95_ms']}ms")
+    return regressions
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def read_report(path):
+    with open(path) as f:
+        return json.load(f)
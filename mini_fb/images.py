@@ -0,0 +1,103 @@
+''' Thumbnail and web-optimized variants for uploaded status images.
+
+Uploads are saved as-is in the request. The resizing happens afterwards in a
+small thread pool, which fills in Image.thumbnail and Image.web_image. Until
+then templates fall back to the original file. Set MINI_FB_IMAGE_WORKERS to 0
+to process images inline, e.g. in tests.
+'''
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image as PILImage, ImageOps
+
+from .models import Image, add_file_refs, bump_feed_versions, bump_status_versions, release_file_refs
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def image_workers():
+    ''' Number of background threads; 0 processes images inline '''
+    return getattr(settings, 'MINI_FB_IMAGE_WORKERS', 2)
+
+
+def get_executor():
+    ''' Returns the shared thread pool, creating it on first use '''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=image_workers(), thread_name_prefix='mini_fb_images')
+        return _executor
+
+
+def render_variant(picture, size, crop):
+    ''' Returns a JPEG ContentFile of picture resized to fit size, or cropped to fill it when crop is set '''
+    if crop:
+        variant = ImageOps.fit(picture, size, PILImage.LANCZOS)
+    else:
+        variant = picture.copy()
+        variant.thumbnail(size, PILImage.LANCZOS)
+    buffer = BytesIO()
+    variant.save(buffer, format='JPEG', quality=getattr(settings, 'MINI_FB_IMAGE_QUALITY', 85), optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_variants(image_id):
+    ''' Generates and stores the thumbnail and web variants of one Image '''
+    try:
+        image = Image.objects.select_related('status_message').get(pk=image_id)
+        with image.image_file.open('rb') as f:
+            picture = PILImage.open(f)
+            picture = ImageOps.exif_transpose(picture).convert('RGB')
+
+        previous = [image.thumbnail.name, image.web_image.name]
+        stem = os.path.splitext(os.path.basename(image.image_file.name))[0]
+        thumbnail = render_variant(picture, getattr(settings, 'MINI_FB_THUMBNAIL_SIZE', (200, 200)), crop=True)
+        web_image = render_variant(picture, getattr(settings, 'MINI_FB_WEB_IMAGE_SIZE', (1280, 1280)), crop=False)
+        image.thumbnail.save(f"{stem}.jpg", thumbnail, save=False)
+        image.web_image.save(f"{stem}.jpg", web_image, save=False)
+
+        # update() so a concurrent edit of the row is not overwritten
+        variants = [image.thumbnail.name, image.web_image.name]
+        if Image.objects.filter(pk=image_id).update(thumbnail=variants[0], web_image=variants[1]):
+            add_file_refs(variants)
+            release_file_refs(previous)
+        else:
+            # The image was deleted meanwhile; drop the variants unless another image uses them
+            add_file_refs(variants)
+            release_file_refs(variants)
+        bump_status_versions(image.status_message_id)
+        bump_feed_versions(image.status_message.profile_id)
+    except Image.DoesNotExist:
+        pass
+    except (OSError, PILImage.DecompressionBombError):
+        logger.exception("Could not generate variants for image %s", image_id)
+
+
+def _run_in_worker(image_ids):
+    try:
+        for image_id in image_ids:
+            generate_variants(image_id)
+    finally:
+        # Worker threads hold their own database connection
+        connection.close()
+
+
+def process_images(image_ids):
+    ''' Schedules variant generation for the given Image ids once the current transaction commits '''
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+    if image_workers() == 0:
+        for image_id in image_ids:
+            generate_variants(image_id)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, image_ids))
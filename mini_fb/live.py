@@ -0,0 +1,136 @@
+''' Live news feed updates for mini_fb.
+
+When a status is created, its id is published to the author and the author's
+friends through a broker. NewsFeedStreamView holds a server-sent events stream
+open per viewer (under ASGI) and forwards the ids it receives. The page then
+fetches only the new items as an HTML fragment.
+
+The stream is off unless MINI_FB_LIVE_FEED is set: under WSGI a streaming
+response is read to the end before anything is sent, so a never-ending stream
+would hold a worker forever. Turn it on only when serving cs412.asgi.
+
+The broker is chosen by the MINI_FB_LIVE_BROKER setting. LocalBroker keeps
+subscribers in process memory, which is enough for a single node and for tests.
+A multi-node deployment can plug in a broker backed by Redis pub/sub or similar
+by implementing the same three methods: publish, subscribe and unsubscribe.
+'''
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def live_feed_enabled():
+    ''' True when news feed pages open the live event stream; needs an ASGI server '''
+    return getattr(settings, 'MINI_FB_LIVE_FEED', False)
+
+
+class Broker:
+    ''' Interface of a live update broker '''
+
+    def publish(self, profile_ids, status_id):
+        ''' Delivers status_id to every subscriber of the given profiles. Called from synchronous code. '''
+        raise NotImplementedError
+
+    def subscribe(self, profile_id):
+        ''' Returns a Subscription receiving the status ids published to profile_id. Called inside an event loop. '''
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        ''' Stops delivering to subscription. Called by Subscription.close() when the stream ends. '''
+        raise NotImplementedError
+
+
+class Subscription:
+    ''' One viewer's stream of status ids, backed by an asyncio queue '''
+
+    def __init__(self, broker, profile_id, maxsize=100):
+        self.broker = broker
+        self.profile_id = profile_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, status_id):
+        ''' Queues status_id from any thread. Ids for a subscriber that has fallen too far behind are dropped. '''
+        def put():
+            if not self.queue.full():
+                self.queue.put_nowait(status_id)
+        self.loop.call_soon_threadsafe(put)
+
+    async def next(self, timeout=None):
+        ''' Returns the next status id, or None if none arrives within timeout seconds '''
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        ''' Detaches from the broker '''
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(Broker):
+    ''' In-process broker. Only reaches viewers connected to the same process. '''
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def publish(self, profile_ids, status_id):
+        with self.lock:
+            targets = [s for pk in profile_ids for s in self.subscriptions.get(pk, ())]
+        for subscription in targets:
+            try:
+                subscription.deliver(status_id)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                self.unsubscribe(subscription)
+
+    def subscribe(self, profile_id):
+        subscription = Subscription(self, profile_id)
+        with self.lock:
+            self.subscriptions[profile_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.profile_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[subscription.profile_id]
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    ''' Returns the broker configured by MINI_FB_LIVE_BROKER, one instance per process '''
+    path = getattr(settings, 'MINI_FB_LIVE_BROKER', 'mini_fb.live.LocalBroker')
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def publish_status(status):
+    ''' Publishes a new status to everyone whose news feed shows it '''
+    get_broker().publish([status.profile_id, *status.profile.get_friend_ids()], status.pk)
+
+
+async def event_stream(profile_id, heartbeat=15):
+    ''' Server-sent events carrying new status ids for a viewer, with a comment line as keep-alive '''
+    subscription = get_broker().subscribe(profile_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            status_id = await subscription.next(timeout=heartbeat)
+            if status_id is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {status_id}\n\n"
+    finally:
+        subscription.close()
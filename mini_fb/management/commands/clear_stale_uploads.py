@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mini_fb.uploads import delete_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Deletes chunked uploads that have not received a chunk for a while, with their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=getattr(settings, 'MINI_FB_UPLOAD_EXPIRY_HOURS', 24),
+            help="Age in hours after which an unfinished upload is deleted",
+        )
+
+    def handle(self, *args, **options):
+        deleted = delete_stale_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} stale uploads"))
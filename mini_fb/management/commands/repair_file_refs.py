@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mini_fb.models import recompute_file_refs
+
+
+class Command(BaseCommand):
+    help = "Recomputes the reference counts of stored image files from the Image table."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        referenced = recompute_file_refs()
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted references to {referenced} files in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mini_fb.models import Profile, recompute_profile_counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes Profile.friend_count, status_count and last_posted_at from the friend and status tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_ids', nargs='*', type=int, help="Profiles to repair (default: all)")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        profile_ids = options['profile_ids'] or list(Profile.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+
+        repaired = 0
+        for start in range(0, len(profile_ids), batch_size):
+            repaired += recompute_profile_counters(profile_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired counters of {repaired} profiles in {time.perf_counter() - started:.1f}s"
+        ))
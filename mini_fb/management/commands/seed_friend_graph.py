@@ -0,0 +1,53 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_fb.seeding import (
+    canonical_edges, create_profiles, create_statuses, insert_edges, power_law_edges, read_edges,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-loads friendships into mini_fb, either from a CSV/JSONL edge list of profile ids "
+        "or as a generated power-law graph of new profiles."
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--edges', help="Path to a .csv or .jsonl edge list of existing profile ids")
+        source.add_argument('--generate', type=int, metavar='PROFILES', help="Number of synthetic profiles to create")
+        parser.add_argument('--degree', type=int, default=5,
+                            help="Edges added per generated profile (the graph's mean degree is about twice this)")
+        parser.add_argument('--statuses', type=int, default=0, help="Status messages to create per generated profile")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, help="Random seed for reproducible graphs")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        rng = random.Random(options['seed'])
+
+        if options['edges']:
+            try:
+                edges = canonical_edges(read_edges(options['edges']))
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read {options['edges']}: {e}")
+            self.stdout.write(f"Read {len(edges)} distinct edges")
+        else:
+            if options['generate'] <= options['degree']:
+                raise CommandError("--generate must be larger than --degree")
+            profile_ids = create_profiles(options['generate'], batch_size, rng)
+            self.stdout.write(f"Created {len(profile_ids)} profiles")
+            edges = power_law_edges(profile_ids, options['degree'], rng)
+            if options['statuses']:
+                created = create_statuses(profile_ids, options['statuses'], batch_size)
+                self.stdout.write(f"Created {created} status messages")
+
+        inserted, existing, unknown = insert_edges(edges, batch_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {inserted} friendships in {elapsed:.1f}s "
+            f"({existing} already existed, {unknown} skipped for unknown profiles)"
+        ))
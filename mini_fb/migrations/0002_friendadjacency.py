@@ -0,0 +1,40 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_adjacency(apps, schema_editor):
+    # Builds the adjacency index from existing friendships, one row per direction
+    Friend = apps.get_model('mini_fb', 'Friend')
+    FriendAdjacency = apps.get_model('mini_fb', 'FriendAdjacency')
+    rows = []
+    for friend_1_id, friend_2_id in Friend.objects.values_list('friend_1_id', 'friend_2_id').iterator():
+        if friend_1_id == friend_2_id:
+            continue
+        rows.append(FriendAdjacency(profile_id=friend_1_id, friend_id=friend_2_id))
+        rows.append(FriendAdjacency(profile_id=friend_2_id, friend_id=friend_1_id))
+    FriendAdjacency.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendAdjacency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reverse_adjacency', to='mini_fb.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adjacency', to='mini_fb.profile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('profile', 'friend'), name='unique_friend_adjacency')],
+            },
+        ),
+        migrations.RunPython(backfill_adjacency, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0002_friendadjacency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statusmessage',
+            name='fanned_out',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='mini_fb.profile')),
+                ('status_message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='mini_fb.statusmessage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-timestamp'], name='timeline_owner_timestamp_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'status_message'), name='unique_timeline_entry')],
+            },
+        ),
+    ]
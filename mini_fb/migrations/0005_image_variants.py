@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0004_statusmessage_profile_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='imgs/thumbs/'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='web_image',
+            field=models.ImageField(blank=True, upload_to='imgs/web/'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+def canonicalize_friendships(apps, schema_editor):
+    # Orders every edge as (lower id, higher id), keeping the oldest copy of each pair
+    # and dropping duplicates and self-friendships so the constraints can be added
+    Friend = apps.get_model('mini_fb', 'Friend')
+    seen = set()
+    redundant = []
+    swapped = []
+    rows = Friend.objects.order_by('timestamp', 'id').values_list('id', 'friend_1_id', 'friend_2_id')
+    for pk, friend_1_id, friend_2_id in rows.iterator():
+        pair = (min(friend_1_id, friend_2_id), max(friend_1_id, friend_2_id))
+        if friend_1_id == friend_2_id or pair in seen:
+            redundant.append(pk)
+            continue
+        seen.add(pair)
+        if friend_1_id > friend_2_id:
+            swapped.append((pk, pair))
+
+    for start in range(0, len(redundant), 500):
+        Friend.objects.filter(id__in=redundant[start:start + 500]).delete()
+    for pk, (friend_1_id, friend_2_id) in swapped:
+        Friend.objects.filter(pk=pk).update(friend_1_id=friend_1_id, friend_2_id=friend_2_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_friendships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friend',
+            constraint=models.UniqueConstraint(fields=('friend_1', 'friend_2'), name='unique_friendship'),
+        ),
+        migrations.AddConstraint(
+            model_name='friend',
+            constraint=models.CheckConstraint(condition=models.Q(('friend_1__lt', models.F('friend_2'))), name='friendship_canonical_order'),
+        ),
+    ]
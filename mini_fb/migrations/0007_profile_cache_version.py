@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0006_canonical_friend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
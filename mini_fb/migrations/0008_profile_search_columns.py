@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def backfill_search_columns(apps, schema_editor):
+    Profile = apps.get_model('mini_fb', 'Profile')
+    Profile.objects.update(
+        first_name_search=Lower(Trim('first_name')),
+        last_name_search=Lower(Trim('last_name')),
+        city_search=Lower(Trim('city')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0007_profile_cache_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='city_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='first_name_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='last_name_search',
+            field=models.CharField(default='', editable=False, max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['last_name_search', 'first_name_search', 'id'], name='profile_directory_idx'),
+        ),
+        migrations.RunPython(backfill_search_columns, migrations.RunPython.noop),
+    ]
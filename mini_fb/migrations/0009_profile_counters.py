@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Profile = apps.get_model('mini_fb', 'Profile')
+    FriendAdjacency = apps.get_model('mini_fb', 'FriendAdjacency')
+    StatusMessage = apps.get_model('mini_fb', 'StatusMessage')
+    friends = FriendAdjacency.objects.filter(profile=OuterRef('pk')).values('profile').annotate(n=Count('id')).values('n')
+    statuses = StatusMessage.objects.filter(profile=OuterRef('pk')).values('profile').annotate(n=Count('id')).values('n')
+    latest = StatusMessage.objects.filter(profile=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    Profile.objects.update(
+        friend_count=Coalesce(Subquery(friends), 0),
+        status_count=Coalesce(Subquery(statuses), 0),
+        last_posted_at=Subquery(latest),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0008_profile_search_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='friend_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='last_posted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='status_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-last_posted_at', 'id'], name='profile_last_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-friend_count', 'id'], name='profile_friend_count_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
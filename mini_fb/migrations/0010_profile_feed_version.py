@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0009_profile_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='feed_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:41
+
+from collections import Counter
+
+from django.db import migrations, models
+import mini_fb.storage
+
+
+def count_file_refs(apps, schema_editor):
+    Image = apps.get_model('mini_fb', 'Image')
+    StoredFile = apps.get_model('mini_fb', 'StoredFile')
+    counts = Counter()
+    for names in Image.objects.values_list('image_file', 'thumbnail', 'web_image').iterator():
+        counts.update(name for name in names if name)
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, ref_count=n) for name, n in counts.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0011_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image_file',
+            field=models.ImageField(storage=mini_fb.storage.image_storage, upload_to='imgs/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='thumbnail',
+            field=models.ImageField(blank=True, storage=mini_fb.storage.image_storage, upload_to='imgs/thumbs/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='web_image',
+            field=models.ImageField(blank=True, storage=mini_fb.storage.image_storage, upload_to='imgs/web/'),
+        ),
+        migrations.RunPython(count_file_refs, migrations.RunPython.noop),
+    ]
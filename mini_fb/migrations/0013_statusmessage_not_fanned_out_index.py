@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_fb', '0012_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='statusmessage',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['profile', 'timestamp', 'id'], name='status_not_fanned_out_idx'),
+        ),
+    ]
@@ -1,7 +1,105 @@
-from django.db import models
+import uuid
+from collections import Counter
+
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.functions import Coalesce, Greatest
+
+from .storage import image_storage
+
+# How long a profile's friend-id set stays cached. Friend changes invalidate it explicitly.
+FRIEND_IDS_CACHE_TIMEOUT = 60 * 15
+
+
+def friend_ids_cache_key(profile_id):
+    ''' Cache key for the set of friend ids of a profile '''
+    return f"mini_fb:friend_ids:{profile_id}"
+
+
+def invalidate_friend_ids(*profile_ids):
+    ''' Drops the cached friend-id sets of the given profiles '''
+    cache.delete_many([friend_ids_cache_key(pk) for pk in profile_ids])
+
+
+def normalize_search(value):
+    ''' Normalized form of a name or city for directory search '''
+    return (value or '').strip().lower()
+
+
+def bump_profile_versions(*profile_ids):
+    ''' Invalidates the cached profile page fragments of the given profiles '''
+    Profile.objects.filter(id__in=profile_ids).update(cache_version=models.F('cache_version') + 1)
+
+
+def bump_feed_versions(*profile_ids):
+    ''' Marks the news feeds showing the given profiles' statuses as changed: their own and their friends' '''
+    Profile.objects.filter(
+        models.Q(id__in=profile_ids) | models.Q(reverse_adjacency__profile_id__in=profile_ids)
+    ).update(feed_version=models.F('feed_version') + 1)
+
+
+def bump_status_versions(*status_ids):
+    ''' Invalidates the cached profile page fragments of the authors of the given statuses '''
+    Profile.objects.filter(statusmessage__in=status_ids).update(cache_version=models.F('cache_version') + 1)
+
+
+def add_file_refs(names):
+    ''' Counts one more reference to each stored image file name (repeats count once each) '''
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    StoredFile.objects.bulk_create([StoredFile(name=name) for name in counts], ignore_conflicts=True)
+    for name, n in counts.items():
+        StoredFile.objects.filter(name=name).update(ref_count=models.F('ref_count') + n)
+
+
+def release_file_refs(names):
+    ''' Drops one reference to each name; files left unreferenced are deleted once the transaction commits '''
+    counts = Counter(name for name in names if name)
+    for name, n in counts.items():
+        StoredFile.objects.filter(name=name).update(ref_count=Greatest(models.F('ref_count') - n, 0))
+
+    def delete_unreferenced():
+        for name in counts:
+            # Only delete if nothing re-referenced the file in the meantime
+            deleted, _ = StoredFile.objects.filter(name=name, ref_count=0).delete()
+            if deleted:
+                image_storage().delete(name)
+    if counts:
+        transaction.on_commit(delete_unreferenced)
+
+
+def recompute_file_refs():
+    ''' Rebuilds the StoredFile reference counts from the Image table. Returns the number of referenced files. '''
+    counts = Counter()
+    for names in Image.objects.values_list('image_file', 'thumbnail', 'web_image').iterator():
+        counts.update(name for name in names if name)
+    with transaction.atomic():
+        StoredFile.objects.all().delete()
+        StoredFile.objects.bulk_create(
+            [StoredFile(name=name, ref_count=n) for name, n in counts.items()], batch_size=1000
+        )
+    return len(counts)
+
+
+def recompute_profile_counters(profile_ids=None):
+    ''' Recomputes friend_count, status_count and last_posted_at from the source tables, for all profiles by default '''
+    profiles = Profile.objects.all() if profile_ids is None else Profile.objects.filter(id__in=profile_ids)
+    friends = FriendAdjacency.objects.filter(profile=models.OuterRef('pk')).values('profile').annotate(n=models.Count('id')).values('n')
+    statuses = StatusMessage.objects.filter(profile=models.OuterRef('pk')).values('profile').annotate(n=models.Count('id')).values('n')
+    latest = StatusMessage.objects.filter(profile=models.OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    return profiles.update(
+        friend_count=Coalesce(models.Subquery(friends), 0),
+        status_count=Coalesce(models.Subquery(statuses), 0),
+        last_posted_at=models.Subquery(latest),
+        cache_version=models.F('cache_version') + 1,
+        feed_version=models.F('feed_version') + 1,
+    )
+
+
 class Profile(models.Model):
     # Profile model for mini_fb. Contains: first_name, last_name, city, email_address & profile_image_url
     first_name = models.CharField(max_length=30)
@@ -15,6 +113,56 @@ class Profile(models.Model):
         null=True,  
         blank=True  
     )
+    # Bumped whenever anything shown on the profile page changes; keys its cached fragments
+    cache_version = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped whenever this profile's news feed changes; the feed API's ETag
+    feed_version = models.PositiveIntegerField(default=0, editable=False)
+    # Lowercased copies of the directory search fields, kept in sync by save().
+    # Prefix searches are range scans on their indexes.
+    first_name_search = models.CharField(max_length=30, db_index=True, editable=False, default='')
+    last_name_search = models.CharField(max_length=30, editable=False, default='')
+    city_search = models.CharField(max_length=50, db_index=True, editable=False, default='')
+
+    # Activity counters, maintained by the Friend and StatusMessage signals.
+    # repair_profile_counters recomputes them after bulk loads.
+    friend_count = models.PositiveIntegerField(default=0, editable=False)
+    status_count = models.PositiveIntegerField(default=0, editable=False)
+    last_posted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Columns maintained with F() updates. Full saves leave them alone so a stale
+    # in-memory copy can't overwrite a concurrent increment.
+    MAINTAINED_FIELDS = ('cache_version', 'feed_version', 'friend_count', 'status_count', 'last_posted_at')
+    # Source field -> normalized search column
+    SEARCH_FIELDS = {'first_name': 'first_name_search', 'last_name': 'last_name_search', 'city': 'city_search'}
+
+    class Meta:
+        indexes = [
+            # Directory order; also serves last name prefix searches
+            models.Index(fields=['last_name_search', 'first_name_search', 'id'], name='profile_directory_idx'),
+            # Directory sorted by activity
+            models.Index(fields=['-last_posted_at', 'id'], name='profile_last_posted_idx'),
+            models.Index(fields=['-friend_count', 'id'], name='profile_friend_count_idx'),
+        ]
+
+    def fill_search_fields(self):
+        ''' Sets the normalized search columns from the name and city. Needed before bulk_create, which skips save(). '''
+        for field, search_field in self.SEARCH_FIELDS.items():
+            setattr(self, search_field, normalize_search(getattr(self, field)))
+
+    def save(self, *args, **kwargs):
+        self.fill_search_fields()
+
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.MAINTAINED_FIELDS
+            ]
+        elif update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                self.SEARCH_FIELDS[f] for f in update_fields if f in self.SEARCH_FIELDS
+            }
+        super().save(*args, **kwargs)
 
 
     def __str__(self):
@@ -24,60 +172,78 @@ class Profile(models.Model):
         return f"{self.first_name} {self.last_name}"
 
     def get_status_messages(self):
-        ''' Returns status messages in decesending order by timestamp'''
-        return self.statusmessage_set.order_by('-timestamp')
+        ''' Returns status messages in decesending order by timestamp, with profiles and images batched in '''
+        return self.statusmessage_set.select_related('profile').prefetch_related('images').order_by('-timestamp', '-id')
     
     def get_absolute_url(self):
         # Returns URL for viewing this profile
         return reverse('show_profile', args=[str(self.id)])
     
     
-    def get_friends(self):
-        ''' Searches all friends tables and returns all friends'''
-        friend_1_relations = Friend.objects.filter(friend_1=self).values_list('friend_2', flat=True)
-        friend_2_relations = Friend.objects.filter(friend_2=self).values_list('friend_1', flat=True)
+    def get_friend_ids(self):
+        ''' Returns the set of friend ids for this profile. Cached, and read from the adjacency index on a miss. '''
+        key = friend_ids_cache_key(self.pk)
+        friend_ids = cache.get(key)
+        if friend_ids is None:
+            friend_ids = set(FriendAdjacency.objects.filter(profile=self).values_list('friend_id', flat=True))
+            cache.set(key, friend_ids, FRIEND_IDS_CACHE_TIMEOUT)
+        return friend_ids
 
-        
-        friend_ids = list(friend_1_relations) + list(friend_2_relations)
-        
-        return Profile.objects.filter(id__in=friend_ids)
+    def get_friends(self):
+        ''' Returns all friends with a single indexed lookup on the adjacency table'''
+        return Profile.objects.filter(reverse_adjacency__profile=self)
     def get_friend_suggestions(self):
-        current_friends = self.get_friends()
-        
-        # Friends which aren't yourself or any of your current friends 
-        suggestions = Profile.objects.exclude(id=self.id).exclude(id__in=current_friends)
-
-        return suggestions
+        ''' Returns friends of friends ranked by mutual friends, then city. Cached per profile. '''
+        from .suggestions import get_suggestions
+        return get_suggestions(self)
 
     def add_friend(self, other):
-        ''' Adds friendship between two profiles. '''
-        existing_friendship = False
-        if self != other:
-            existing_friendship = Friend.objects.filter(
-                models.Q(friend_1=self, friend_2=other) | models.Q(friend_1=other, friend_2=self)
-            ).exists()
-
-        # Only create if no existing friendship is found
-        if not existing_friendship:
-            Friend.objects.create(friend_1=self, friend_2=other)
-            
-            
+        ''' Adds friendship between two profiles. Returns True if a new friendship was created. '''
+        # A profile can't be friends with itself
+        if self == other:
+            return False
+
+        # A single insert of the canonical edge; the unique constraint makes repeats a no-op.
+        # The Friend post_save signal writes the adjacency rows and backfills the
+        # timelines in the same transaction, so they commit together or not at all.
+        friend_1, friend_2 = Friend.canonical_pair(self, other)
+        try:
+            with transaction.atomic():
+                Friend.objects.create(friend_1=friend_1, friend_2=friend_2)
+        except IntegrityError:
+            return False
+        return True
+
     def get_news_feed(self):
         ''' Returns news feed by combining own statuses and statuses of friends. '''
-      
+        from .timeline import fanout_enabled, get_timeline
+        if fanout_enabled():
+            return get_timeline(self)
+
         own_statuses = self.get_status_messages()
         friends = self.get_friends()
         
         friends_statuses = StatusMessage.objects.filter(profile__in=friends)
 
         news_feed = own_statuses | friends_statuses
-        return news_feed.order_by('-timestamp')
+        return news_feed.select_related('profile').prefetch_related('images').order_by('-timestamp', '-id')
 
 class StatusMessage(models.Model):
     # Status model for mini_fb. Contains a message, timestamp of the message and foreign key relationship to Profile
     message = models.CharField(max_length=300)
     timestamp = models.DateTimeField(default=timezone.now)
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    # Set once the status has been pushed into its readers' timelines
+    fanned_out = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of a profile's statuses on (timestamp, id)
+            models.Index(fields=['profile', 'timestamp', 'id'], name='status_profile_timestamp_idx'),
+            # Backs reading the statuses that were not fanned out into timelines
+            models.Index(fields=['profile', 'timestamp', 'id'], condition=models.Q(fanned_out=False),
+                         name='status_not_fanned_out_idx'),
+        ]
 
     def __str__(self):
         ''' Replaces built-in two string method with custom one that returns first, last name and message. '''
@@ -92,14 +258,117 @@ class Image(models.Model):
     
     timestamp = models.DateTimeField(default=timezone.now)
     status_message = models.ForeignKey(StatusMessage, on_delete=models.CASCADE, related_name='images') 
-    image_file = models.ImageField(upload_to='imgs/')  # No related_name needed here
+    # Files are stored once per distinct content and shared between rows; see StoredFile
+    image_file = models.ImageField(upload_to='imgs/', storage=image_storage)  # No related_name needed here
+    # Variants generated in the background after upload. Empty until processing finishes.
+    thumbnail = models.ImageField(upload_to='imgs/thumbs/', storage=image_storage, blank=True)
+    web_image = models.ImageField(upload_to='imgs/web/', storage=image_storage, blank=True)
+
+    # File fields whose stored files are reference counted
+    FILE_FIELDS = ('image_file', 'thumbnail', 'web_image')
+
+    def file_names(self):
+        ''' Stored names of this image's files '''
+        return [getattr(self, field).name for field in self.FILE_FIELDS]
+
+    @property
+    def thumbnail_url(self):
+        ''' URL of the thumbnail, or of the original while it is still being generated '''
+        return (self.thumbnail or self.image_file).url
+
+    @property
+    def web_image_url(self):
+        ''' URL of the web-optimized variant, or of the original while it is still being generated '''
+        return (self.web_image or self.image_file).url
 
     
 class Friend(models.Model):
     # Friend model for mini_fb. Contains two foreign key relationships to Profile, and a timestamp.
+    # Each friendship is stored once, canonically, with the lower profile id as friend_1.
     friend_1 = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='profile1')
     friend_2 = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='profile2')
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['friend_1', 'friend_2'], name='unique_friendship'),
+            models.CheckConstraint(condition=models.Q(friend_1__lt=models.F('friend_2')), name='friendship_canonical_order'),
+        ]
+
+    @staticmethod
+    def canonical_pair(profile, other):
+        ''' Returns the two profiles ordered as (friend_1, friend_2) '''
+        return (profile, other) if profile.pk < other.pk else (other, profile)
+
+    def save(self, *args, **kwargs):
+        # Store the edge in canonical order however it was built
+        if self.friend_1_id is not None and self.friend_2_id is not None and self.friend_1_id > self.friend_2_id:
+            self.friend_1, self.friend_2 = self.friend_2, self.friend_1
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.friend_1.first_name} {self.friend_1.last_name} & {self.friend_2.first_name} {self.friend_2.last_name}"
+
+
+class FriendAdjacency(models.Model):
+    # Adjacency index for the friend graph. Every Friend is stored here once per direction,
+    # so a profile's friends are a single lookup on the (profile, friend) unique index.
+    # Kept in sync with Friend by the post_save and post_delete signals.
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='adjacency')
+    friend = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='reverse_adjacency')
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'friend'], name='unique_friend_adjacency'),
+        ]
+
+    def __str__(self):
+        return f"{self.profile_id} -> {self.friend_id}"
+
+
+class TimelineEntry(models.Model):
+    # Fan-out-on-write news feed row: one status pushed into one profile's timeline.
+    # timestamp mirrors the status timestamp so a timeline is a range scan on (owner, timestamp).
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='timeline_entries')
+    status_message = models.ForeignKey(StatusMessage, on_delete=models.CASCADE, related_name='timeline_entries')
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'status_message'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-timestamp'], name='timeline_owner_timestamp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id}: {self.status_message_id}"
+
+
+class ChunkedUpload(models.Model):
+    # A status image being uploaded in chunks. The bytes received so far are kept
+    # under MEDIA_ROOT/chunks until the file is attached to a status as an Image.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Number of bytes received, where the next chunk must start
+    offset = models.PositiveBigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+
+class StoredFile(models.Model):
+    # Reference count of a content-addressed image file: the number of Image
+    # file fields naming it. Kept up to date by the Image signals and by callers
+    # of bulk_create/update(); repair_file_refs recomputes it from Image.
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
-        return f"{self.friend_1.first_name} {self.friend_1.last_name} & {self.friend_2.first_name} {self.friend_2.last_name}"
\ No newline at end of file
+        return f"{self.name} ({self.ref_count})"
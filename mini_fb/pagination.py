@@ -0,0 +1,126 @@
+''' Keyset (cursor) pagination for mini_fb status message lists.
+
+Pages are ordered by (timestamp, id) descending and the cursor encodes the
+last row of the previous page, so fetching page N is one index range scan no
+matter how deep N is. Cursors are opaque url-safe strings.
+'''
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def page_size():
+    ''' Number of status messages per page '''
+    return getattr(settings, 'MINI_FB_PAGE_SIZE', 20)
+
+
+def encode_cursor(status):
+    ''' Returns an opaque cursor pointing just after the given status '''
+    raw = f"{status.timestamp.isoformat()}|{status.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    ''' Returns the (timestamp, id) pair of a cursor. Raises ValueError on malformed input. '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (TypeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def paginate_statuses(queryset, cursor=None, size=None):
+    ''' Returns (statuses, next_cursor) for the page after cursor. next_cursor is None on the last page.
+
+    cursor may be an encoded cursor or an already decoded (timestamp, id) pair.
+    '''
+    size = size or page_size()
+    queryset = queryset.order_by('-timestamp', '-id')
+    if cursor:
+        timestamp, pk = decode_cursor(cursor) if isinstance(cursor, str) else cursor
+        # The plain bound on timestamp lets the index range scan start at the cursor; the OR alone cannot
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk), timestamp__lte=timestamp)
+
+    # Fetch one extra row to know whether there is a next page
+    statuses = list(queryset[:size + 1])
+    next_cursor = encode_cursor(statuses[size - 1]) if len(statuses) > size else None
+    return statuses[:size], next_cursor
+
+
+def statuses_since(queryset, since=None, size=None):
+    ''' Returns (statuses, cursor, has_more) for up to size statuses newer than the since cursor, oldest first.
+
+    Without since it returns the newest page. cursor points at the newest status
+    returned, or is since itself when nothing is newer, ready for the next poll.
+    '''
+    size = size or page_size()
+    if not since:
+        statuses = list(queryset.order_by('-timestamp', '-id')[:size])[::-1]
+        return statuses, encode_cursor(statuses[-1]) if statuses else None, False
+
+    timestamp, pk = decode_cursor(since)
+    queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk), timestamp__gte=timestamp)
+    statuses = list(queryset.order_by('timestamp', 'id')[:size + 1])
+    has_more = len(statuses) > size
+    statuses = statuses[:size]
+    return statuses, encode_cursor(statuses[-1]) if statuses else since, has_more
+
+
+class CappedPage(Page):
+    ''' Page of a capped paginator, which knows from its own rows whether another page follows '''
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+
+class CappedCountPaginator(Paginator):
+    ''' Page-number paginator that counts at most count_cap + 1 rows, so counting costs the same on any table size.
+
+    Past the cap, pages are not checked against the count: each page fetches
+    one extra row to know whether there is a next page, so every row stays
+    reachable.
+    '''
+    count_cap = 1000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.count_cap + 1].count()
+
+    @property
+    def is_capped(self):
+        ''' True when there are more rows than were counted '''
+        return self.count > self.count_cap
+
+    def validate_number(self, number):
+        if not self.is_capped:
+            return super().validate_number(number)
+        # Only the lower bound is known; page() finds out whether the page has rows
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        if not self.is_capped:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows:
+            raise EmptyPage(self.error_messages['no_results'])
+        return CappedPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
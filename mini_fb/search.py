@@ -0,0 +1,37 @@
+''' Prefix search over the profile directory.
+
+Profile keeps lowercased, indexed copies of first name, last name and city. A
+prefix match is written as a range on those columns (prefix <= value < prefix
++ U+10FFFF), which any database answers from the B-tree index. LIKE 'abc%' is
+not used because SQLite won't use an index for it.
+'''
+from django.db.models import F, Q
+
+from .models import Profile, normalize_search
+
+# Sorts after every character that can follow a prefix
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+# Directory orderings by ?sort=, each backed by an index on Profile
+SORTS = {
+    'name': ('last_name_search', 'first_name_search', 'id'),
+    'active': (F('last_posted_at').desc(nulls_last=True), 'id'),
+    'popular': ('-friend_count', 'id'),
+}
+
+
+def prefix_match(field, prefix):
+    ''' Q matching rows whose field starts with prefix '''
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + PREFIX_UPPER_BOUND})
+
+
+def search_profiles(query, sort='name'):
+    ''' Returns profiles where every word of query prefixes their first name, last name or city, ordered by sort '''
+    profiles = Profile.objects.all()
+    for term in normalize_search(query).split():
+        profiles = profiles.filter(
+            prefix_match('first_name_search', term)
+            | prefix_match('last_name_search', term)
+            | prefix_match('city_search', term)
+        )
+    return profiles.order_by(*SORTS.get(sort, SORTS['name']))
@@ -0,0 +1,145 @@
+''' Bulk loading of social graphs into mini_fb.
+
+Edges are canonicalized to (lower id, higher id) and deduplicated in memory,
+then written with batched bulk_create into Friend and FriendAdjacency. Both
+tables' unique constraints make re-running a load idempotent. Used by the
+seed_friend_graph management command and the benchmark suite.
+'''
+import csv
+import json
+import random
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import (
+    Friend, FriendAdjacency, Profile, StatusMessage,
+    bump_feed_versions, friend_ids_cache_key, recompute_profile_counters,
+)
+from .suggestions import suggestions_cache_key
+
+FIRST_NAMES = ['Ada', 'Ben', 'Cleo', 'Dev', 'Eli', 'Fay', 'Gus', 'Hana', 'Ivo', 'Jun', 'Kai', 'Lea', 'Max', 'Nia', 'Oli', 'Pia']
+LAST_NAMES = ['Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Fox', 'Gupta', 'Hill', 'Ito', 'Jones', 'Khan', 'Lee', 'Moore', 'Nunez']
+CITIES = ['Boston', 'Cambridge', 'Newton', 'Somerville', 'Brookline', 'Quincy', 'Medford', 'Waltham']
+
+
+def canonical_edges(pairs):
+    ''' Returns the set of distinct (lower id, higher id) edges in pairs, without self-loops '''
+    edges = set()
+    for a, b in pairs:
+        a, b = int(a), int(b)
+        if a != b:
+            edges.add((a, b) if a < b else (b, a))
+    return edges
+
+
+def read_edges(path):
+    ''' Streams (friend_1, friend_2) profile id pairs from a CSV or JSONL edge list.
+
+    CSV rows hold two ids, with an optional header. JSONL lines hold either
+    [id, id] or {"friend_1": id, "friend_2": id}.
+    '''
+    with open(path, newline='') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    edge = json.loads(line)
+                    yield (edge['friend_1'], edge['friend_2']) if isinstance(edge, dict) else tuple(edge)
+        else:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[0].strip().isdigit() and row[1].strip().isdigit():
+                    yield row[0], row[1]
+
+
+def power_law_edges(profile_ids, edges_per_profile, rng=random):
+    ''' Returns a preferential-attachment (Barabasi-Albert) graph over profile_ids.
+
+    Each profile after the first edges_per_profile links to that many earlier
+    profiles, chosen with probability proportional to their degree, which gives
+    the heavy-tailed degree distribution of real social graphs.
+    '''
+    edges = set()
+    # Every endpoint of every edge so far; sampling from it is degree-weighted
+    endpoints = []
+    for i in range(edges_per_profile, len(profile_ids)):
+        source = profile_ids[i]
+        targets = set()
+        while len(targets) < edges_per_profile:
+            targets.add(rng.choice(endpoints) if endpoints else rng.choice(profile_ids[:i]))
+        for target in targets:
+            edges.add((target, source) if target < source else (source, target))
+            endpoints += [source, target]
+    return edges
+
+
+def create_profiles(count, batch_size=1000, rng=random):
+    ''' Creates count synthetic profiles and returns their ids '''
+    profiles = [
+        Profile(
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            city=rng.choice(CITIES),
+            email_address=f"seed{i}@example.com",
+            profile_image_url=f"https://picsum.photos/seed/{i}/200",
+        )
+        for i in range(count)
+    ]
+    # bulk_create skips Profile.save(), which fills the directory search columns
+    for profile in profiles:
+        profile.fill_search_fields()
+    return [p.pk for p in Profile.objects.bulk_create(profiles, batch_size=batch_size)]
+
+
+def create_statuses(profile_ids, per_profile, batch_size=1000):
+    ''' Creates per_profile status messages for each profile and returns how many were created '''
+    statuses = [
+        StatusMessage(profile_id=profile_id, message=f"Seeded status {n}")
+        for profile_id in profile_ids for n in range(per_profile)
+    ]
+    StatusMessage.objects.bulk_create(statuses, batch_size=batch_size)
+    # bulk_create sends no signals, so bring the counters, page and feed versions up to date
+    for start in range(0, len(profile_ids), batch_size):
+        recompute_profile_counters(profile_ids[start:start + batch_size])
+        bump_feed_versions(*profile_ids[start:start + batch_size])
+    return len(statuses)
+
+
+def insert_edges(edges, batch_size=1000):
+    ''' Inserts canonical edges into Friend and FriendAdjacency. Returns (inserted, existing, unknown) edge counts.
+
+    Edges whose profiles do not exist are skipped as unknown. Existing friendships are left untouched.
+    '''
+    edges = list(edges)
+    referenced = sorted({pk for edge in edges for pk in edge})
+    known = set()
+    for start in range(0, len(referenced), batch_size):
+        known.update(Profile.objects.filter(id__in=referenced[start:start + batch_size]).values_list('id', flat=True))
+    unknown = len(edges)
+    edges = [(a, b) for a, b in edges if a in known and b in known]
+    unknown -= len(edges)
+
+    existing = 0
+    with transaction.atomic():
+        for start in range(0, len(edges), batch_size):
+            batch = edges[start:start + batch_size]
+            # ignore_conflicts doesn't say which rows were skipped, so count the existing ones first
+            present = Friend.objects.filter(
+                friend_1_id__in={a for a, _ in batch}, friend_2_id__in={b for _, b in batch}
+            ).values_list('friend_1_id', 'friend_2_id')
+            existing += len(set(present) & set(batch))
+            Friend.objects.bulk_create(
+                [Friend(friend_1_id=a, friend_2_id=b) for a, b in batch], ignore_conflicts=True
+            )
+            FriendAdjacency.objects.bulk_create(
+                [FriendAdjacency(profile_id=a, friend_id=b) for a, b in batch]
+                + [FriendAdjacency(profile_id=b, friend_id=a) for a, b in batch],
+                ignore_conflicts=True,
+            )
+
+    # bulk_create skips add_friend and the signals, so redo their cache invalidation and counting
+    touched = {pk for edge in edges for pk in edge}
+    cache.delete_many([friend_ids_cache_key(pk) for pk in touched] + [suggestions_cache_key(pk) for pk in touched])
+    touched = sorted(touched)
+    for start in range(0, len(touched), batch_size):
+        recompute_profile_counters(touched[start:start + batch_size])
+    return len(edges) - existing, existing, unknown
@@ -0,0 +1,183 @@
+import os
+from collections import Counter
+
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    ChunkedUpload, Friend, FriendAdjacency, Image, Profile, StatusMessage,
+    add_file_refs, bump_feed_versions, bump_profile_versions, bump_status_versions, invalidate_friend_ids,
+    release_file_refs,
+)
+from .live import live_feed_enabled, publish_status
+from .suggestions import invalidate_suggestions
+from .timeline import backfill_friendship, remove_friendship
+from .uploads import upload_path
+
+
+def invalidate_friendship_caches(pair, affected):
+    ''' Drops the cached friend ids of a changed friendship's profiles and the suggestions of everyone they know '''
+    # Only once the rows are visible to other requests: clearing earlier would let a concurrent
+    # request cache the old state, and a rollback never commits
+    def invalidate():
+        invalidate_friend_ids(*pair)
+        invalidate_suggestions(*pair, *affected)
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Friend)
+def add_friend_adjacency(sender, instance, created, **kwargs):
+    ''' Adds both adjacency rows of a new friendship, however it was created (add_friend, the admin, a script) '''
+    if not created:
+        return
+    FriendAdjacency.objects.bulk_create([
+        FriendAdjacency(profile_id=instance.friend_1_id, friend_id=instance.friend_2_id),
+        FriendAdjacency(profile_id=instance.friend_2_id, friend_id=instance.friend_1_id),
+    ], ignore_conflicts=True)
+    pair = [instance.friend_1_id, instance.friend_2_id]
+    # Mutual-friend counts change for both profiles and everyone they know. Read who that is
+    # from the adjacency rows, as get_friend_ids() would cache the uncommitted friendship.
+    affected = set(FriendAdjacency.objects.filter(profile_id__in=pair).values_list('friend_id', flat=True))
+    invalidate_friendship_caches(pair, affected)
+    backfill_friendship(instance.friend_1, instance.friend_2)
+
+
+@receiver(post_delete, sender=Friend)
+def remove_friend_adjacency(sender, instance, **kwargs):
+    ''' Removes both adjacency rows of a deleted friendship and drops the cached friend ids and suggestions '''
+    # Mutual-friend counts change for both profiles and everyone they know; read who that is before the rows go
+    affected = set(
+        FriendAdjacency.objects.filter(profile_id__in=[instance.friend_1_id, instance.friend_2_id])
+        .values_list('friend_id', flat=True)
+    )
+    FriendAdjacency.objects.filter(
+        profile_id__in=[instance.friend_1_id, instance.friend_2_id],
+        friend_id__in=[instance.friend_1_id, instance.friend_2_id],
+    ).delete()
+    invalidate_friendship_caches([instance.friend_1_id, instance.friend_2_id], affected)
+    remove_friendship(instance.friend_1_id, instance.friend_2_id)
+
+
+# Profile page fragment versions and activity counters. Every change to something
+# the page shows bumps the version of each profile whose page shows it.
+
+@receiver(post_save, sender=Profile)
+def bump_version_on_profile_save(sender, instance, **kwargs):
+    ''' A profile's name and picture appear on its own page and in its friends' friend lists '''
+    bump_profile_versions(instance.pk, *instance.get_friend_ids())
+
+
+@receiver(post_save, sender=StatusMessage)
+def count_status_on_save(sender, instance, created, **kwargs):
+    ''' New statuses update the author's counters; any save invalidates the author's page '''
+    profiles = Profile.objects.filter(pk=instance.profile_id)
+    if not created:
+        profiles.update(cache_version=F('cache_version') + 1)
+        return
+    profiles.update(
+        status_count=F('status_count') + 1,
+        last_posted_at=Case(
+            When(last_posted_at__gte=instance.timestamp, then=F('last_posted_at')),
+            default=Value(instance.timestamp),
+        ),
+        cache_version=F('cache_version') + 1,
+    )
+
+
+@receiver(post_delete, sender=StatusMessage)
+def count_status_on_delete(sender, instance, **kwargs):
+    latest = StatusMessage.objects.filter(profile=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    Profile.objects.filter(pk=instance.profile_id).update(
+        status_count=Greatest(F('status_count') - 1, 0),
+        last_posted_at=Subquery(latest),
+        cache_version=F('cache_version') + 1,
+    )
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def bump_version_on_image_change(sender, instance, **kwargs):
+    bump_status_versions(instance.status_message_id)
+
+
+@receiver(post_save, sender=Friend)
+def count_friend_on_save(sender, instance, created, **kwargs):
+    Profile.objects.filter(id__in=[instance.friend_1_id, instance.friend_2_id]).update(
+        friend_count=F('friend_count') + (1 if created else 0),
+        cache_version=F('cache_version') + 1,
+    )
+
+
+@receiver(post_delete, sender=Friend)
+def count_friend_on_delete(sender, instance, **kwargs):
+    Profile.objects.filter(id__in=[instance.friend_1_id, instance.friend_2_id]).update(
+        friend_count=Greatest(F('friend_count') - 1, 0),
+        cache_version=F('cache_version') + 1,
+    )
+
+
+# News feed versions. Any change to a status, its images, its author or a
+# friendship changes the feeds of the profiles involved and of their friends.
+
+@receiver(post_save, sender=Profile)
+def bump_feed_version_on_profile_save(sender, instance, **kwargs):
+    bump_feed_versions(instance.pk)
+
+
+@receiver(post_save, sender=StatusMessage)
+@receiver(post_delete, sender=StatusMessage)
+def bump_feed_version_on_status_change(sender, instance, **kwargs):
+    bump_feed_versions(instance.profile_id)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def bump_feed_version_on_image_change(sender, instance, **kwargs):
+    bump_feed_versions(*Profile.objects.filter(statusmessage=instance.status_message_id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Friend)
+@receiver(post_delete, sender=Friend)
+def bump_feed_version_on_friend_change(sender, instance, **kwargs):
+    bump_feed_versions(instance.friend_1_id, instance.friend_2_id)
+
+
+@receiver(post_save, sender=StatusMessage)
+def publish_new_status(sender, instance, created, **kwargs):
+    ''' Pushes new statuses to connected news feed viewers once they are committed '''
+    if created and live_feed_enabled():
+        transaction.on_commit(lambda: publish_status(instance))
+
+
+@receiver(post_delete, sender=ChunkedUpload)
+def remove_upload_file(sender, instance, **kwargs):
+    ''' Removes the partial file of an abandoned upload; attached uploads have already been moved '''
+    try:
+        os.remove(upload_path(instance))
+    except FileNotFoundError:
+        pass
+
+
+@receiver(pre_save, sender=Image)
+def remember_image_file_names(sender, instance, **kwargs):
+    ''' Notes the file names an edited image had, so post_save can move its references '''
+    old = Image.objects.filter(pk=instance.pk).values_list(*Image.FILE_FIELDS).first() if instance.pk else None
+    instance._old_file_names = list(old) if old else []
+
+
+@receiver(post_save, sender=Image)
+def add_image_file_refs(sender, instance, created, **kwargs):
+    ''' Counts the files of a new image; an edit (the admin) moves the references from the old names to the new '''
+    new = Counter(name for name in instance.file_names() if name)
+    old = Counter() if created else Counter(name for name in getattr(instance, '_old_file_names', []) if name)
+    add_file_refs((new - old).elements())
+    release_file_refs((old - new).elements())
+
+
+@receiver(post_delete, sender=Image)
+def release_image_file_refs(sender, instance, **kwargs):
+    ''' Deleting a status deletes its images; their files go once no other image uses them '''
+    release_file_refs(instance.file_names())
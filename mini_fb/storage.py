@@ -0,0 +1,48 @@
+''' Content-addressed file storage for status images.
+
+Files are stored under the SHA-256 digest of their content, so uploading the same
+picture twice stores it once. Which rows use a file is tracked by StoredFile
+reference counts (see models.add_file_refs and release_file_refs); a file is only
+deleted when its last reference goes away.
+'''
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    ''' FileSystemStorage that names each file after the digest of its content, keeping its directory and extension '''
+
+    def digest_name(self, name, content):
+        ''' Returns dir/ab/<digest><ext> for a file saved as dir/<name><ext>, reading content once in chunks '''
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.digest_name(name, content)
+        # Identical content is already stored under this name
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+_image_storage = None
+
+
+def image_storage():
+    ''' Storage of Image files. A callable, so migrations refer to it instead of serializing an instance. '''
+    global _image_storage
+    if _image_storage is None:
+        _image_storage = ContentAddressedStorage()
+    return _image_storage
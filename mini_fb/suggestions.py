@@ -0,0 +1,78 @@
+''' Ranked friend suggestions for mini_fb.
+
+Candidates are friends of friends ranked by mutual-friend count, with living in
+the same city as a secondary signal and friend count as a tie-breaker. They come from one aggregate query over the
+FriendAdjacency index. The top MINI_FB_SUGGESTIONS_LIMIT results are cached per
+profile and invalidated once a friendship change commits.
+'''
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import FriendAdjacency, Profile
+
+SUGGESTIONS_CACHE_TIMEOUT = 60 * 15
+
+
+def suggestions_limit():
+    ''' Maximum number of suggestions returned for a profile '''
+    return getattr(settings, 'MINI_FB_SUGGESTIONS_LIMIT', 10)
+
+
+def suggestions_cache_key(profile_id):
+    ''' Cache key for the ranked suggestions of a profile '''
+    return f"mini_fb:suggestions:{profile_id}"
+
+
+def invalidate_suggestions(*profile_ids):
+    ''' Drops the cached suggestions of the given profiles '''
+    cache.delete_many([suggestions_cache_key(pk) for pk in profile_ids])
+
+
+def same_city(field, city):
+    ''' 1 when field matches city, else 0, for use as a ranking key '''
+    return Case(When(**{field: city}, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def rank_suggestions(profile, limit):
+    ''' Returns [(profile_id, mutual_friends)] for the best `limit` candidates, best first '''
+    friend_ids = profile.get_friend_ids()
+    excluded = friend_ids | {profile.pk}
+
+    # Friends of friends, counted once per mutual friend
+    ranked = list(
+        FriendAdjacency.objects.filter(profile_id__in=friend_ids)
+        .exclude(friend_id__in=excluded)
+        .values('friend_id')
+        .annotate(mutual_friends=Count('id'), same_city=same_city('friend__city', profile.city))
+        .order_by('-mutual_friends', '-same_city', '-friend__friend_count', 'friend_id')
+        .values_list('friend_id', 'mutual_friends')[:limit]
+    )
+
+    # Top up with unconnected profiles, same city first, when the graph is sparse
+    if len(ranked) < limit:
+        excluded |= {pk for pk, _ in ranked}
+        ranked += [
+            (pk, 0) for pk in Profile.objects.exclude(id__in=excluded)
+            .annotate(same_city=same_city('city', profile.city))
+            .order_by('-same_city', '-friend_count', 'id')
+            .values_list('id', flat=True)[:limit - len(ranked)]
+        ]
+    return ranked
+
+
+def get_suggestions(profile):
+    ''' Returns the ranked suggestions of a profile as Profile objects annotated with mutual_friends '''
+    key = suggestions_cache_key(profile.pk)
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = rank_suggestions(profile, suggestions_limit())
+        cache.set(key, ranked, SUGGESTIONS_CACHE_TIMEOUT)
+
+    profiles = Profile.objects.in_bulk([pk for pk, _ in ranked])
+    suggestions = []
+    for pk, mutual_friends in ranked:
+        if pk in profiles:
+            profiles[pk].mutual_friends = mutual_friends
+            suggestions.append(profiles[pk])
+    return suggestions
@@ -1,3 +1,836 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import EmptyPage
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image as PILImage
+
+from . import benchmarks
+from .images import process_images
+from .live import get_broker
+from .pagination import CappedCountPaginator, encode_cursor, paginate_statuses, statuses_since
+from .search import search_profiles
+from .seeding import canonical_edges, read_edges
+from .suggestions import suggestions_cache_key
+from .timeline import fan_out_status
+from .uploads import attach_uploads, delete_stale_uploads, upload_path
+from .models import ChunkedUpload, Friend, FriendAdjacency, Image, Profile, StatusMessage, StoredFile, TimelineEntry
+
+
+def make_profile(name, **kwargs):
+    ''' Creates a Profile with placeholder contact details '''
+    return Profile.objects.create(
+        first_name=name, last_name='Test', city='Boston',
+        email_address=f"{name}@example.com", profile_image_url='https://example.com/p.jpg', **kwargs
+    )
+
+
+def png_bytes(size=(32, 32), color='red'):
+    ''' A solid-color PNG image '''
+    buffer = BytesIO()
+    PILImage.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def png_upload(size=(32, 32), color='red'):
+    ''' A solid-color PNG image as an uploaded file '''
+    return SimpleUploadedFile('photo.png', png_bytes(size, color), content_type='image/png')
+
+
+class TemporaryMediaMixin:
+    ''' Stores uploaded files in a temporary MEDIA_ROOT, removed after each test '''
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ProfileCounterTests(TestCase):
+    ''' friend_count, status_count and last_posted_at follow friend and status changes '''
+
+    def assertCounters(self, profile, friends, statuses, last_posted_at):
+        profile.refresh_from_db()
+        self.assertEqual((profile.friend_count, profile.status_count, profile.last_posted_at),
+                         (friends, statuses, last_posted_at))
+
+    def test_counters_are_maintained(self):
+        profile, friend = make_profile('profile'), make_profile('friend')
+        profile.add_friend(friend)
+        profile.add_friend(friend)
+        first = StatusMessage.objects.create(profile=profile, message='first')
+        second = StatusMessage.objects.create(profile=profile, message='second')
+        self.assertCounters(profile, 1, 2, second.timestamp)
+        self.assertCounters(friend, 1, 0, None)
+
+        second.delete()
+        self.assertCounters(profile, 1, 1, first.timestamp)
+        Friend.objects.all().delete()
+        self.assertCounters(friend, 0, 0, None)
+
+    def test_repair_command(self):
+        profile, friend = make_profile('profile'), make_profile('friend')
+        profile.add_friend(friend)
+        status = StatusMessage.objects.create(profile=profile, message='status')
+        Profile.objects.update(friend_count=7, status_count=7, last_posted_at=None)
+
+        call_command('repair_profile_counters', stdout=StringIO())
+        self.assertCounters(profile, 1, 1, status.timestamp)
+        self.assertCounters(friend, 1, 0, None)
+
+
+class AddFriendTests(TestCase):
+    ''' Friendships are stored once, in canonical order '''
+
+    def setUp(self):
+        cache.clear()
+
+    def test_add_friend_is_idempotent(self):
+        first, second = make_profile('first'), make_profile('second')
+        self.assertTrue(second.add_friend(first))
+        self.assertFalse(first.add_friend(second))
+        self.assertFalse(first.add_friend(first))
+
+        friend = Friend.objects.get()
+        self.assertEqual((friend.friend_1, friend.friend_2), (first, second))
+        self.assertEqual(list(first.get_friends()), [second])
+        self.assertEqual(list(second.get_friends()), [first])
+
+    def test_friends_created_directly_are_mirrored(self):
+        first, second = make_profile('first'), make_profile('second')
+        self.assertEqual(list(first.get_friends()), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Friend.objects.create(friend_1=first, friend_2=second)
+        self.assertEqual(list(first.get_friends()), [second])
+        self.assertEqual(second.get_friend_ids(), {first.pk})
+
+    def test_failed_adjacency_insert_leaves_no_edge(self):
+        first, second = make_profile('first'), make_profile('second')
+        with mock.patch.object(FriendAdjacency.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                first.add_friend(second)
+        self.assertFalse(Friend.objects.exists())
+
+        # Nothing was half-written, so a retry succeeds
+        self.assertTrue(first.add_friend(second))
+        self.assertEqual(list(first.get_friends()), [second])
+
+    def test_rolled_back_friendship_is_not_cached(self):
+        first, second = make_profile('first'), make_profile('second')
+        self.assertEqual(first.get_friend_ids(), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError):
+                with transaction.atomic():
+                    first.add_friend(second)
+                    raise DatabaseError
+        self.assertFalse(Friend.objects.exists())
+        self.assertEqual(first.get_friend_ids(), set())
+        self.assertEqual(second.get_friend_ids(), set())
+
+
+@override_settings(MINI_FB_PAGE_SIZE=500)
+class StatusImagePrefetchTests(TestCase):
+    ''' Feed and profile rendering must not query once per status '''
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('viewer', password='password')
+        self.profile = make_profile('viewer', user=self.user)
+        self.friend = make_profile('friend')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.add_friend(self.friend)
+        self.client.force_login(self.user)
+
+    def post_statuses(self, count):
+        for i in range(count):
+            author = self.profile if i % 2 else self.friend
+            status = StatusMessage.objects.create(profile=author, message=f"status {i}")
+            Image.objects.create(status_message=status, image_file=f"imgs/{i}.jpg")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_news_feed_query_count_is_constant(self):
+        self.post_statuses(2)
+        baseline = self.count_queries(reverse('show_news_feed'))
+
+        self.post_statuses(198)
+        self.assertEqual(self.count_queries(reverse('show_news_feed')), baseline)
+
+    def test_profile_page_query_count_is_constant(self):
+        url = reverse('show_profile', args=[self.profile.pk])
+        self.post_statuses(2)
+        baseline = self.count_queries(url)
+
+        self.post_statuses(198)
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_news_feed_batches_profiles_and_images(self):
+        self.post_statuses(200)
+        # One query for the statuses and their profiles, one for all of their images
+        with self.assertNumQueries(2):
+            for status in self.profile.get_news_feed():
+                status.profile.first_name
+                list(status.images.all())
+
+    @override_settings(MINI_FB_FEED_FANOUT=True)
+    def test_timeline_feed_query_count_is_constant(self):
+        self.post_statuses(2)
+        # Warm the cached friend ids, which the feed reads
+        self.client.get(reverse('show_news_feed'))
+        baseline = self.count_queries(reverse('show_news_feed'))
+
+        self.post_statuses(198)
+        self.assertEqual(self.count_queries(reverse('show_news_feed')), baseline)
+
+
+@override_settings(MINI_FB_IMAGE_WORKERS=0, MINI_FB_THUMBNAIL_SIZE=(50, 50), MINI_FB_WEB_IMAGE_SIZE=(400, 400))
+class ImageVariantTests(TemporaryMediaMixin, TestCase):
+    ''' Uploaded status images get a thumbnail and a web-sized variant '''
+
+    def setUp(self):
+        super().setUp()
+        self.status = StatusMessage.objects.create(profile=make_profile('author'), message='photo')
+
+    def test_variants_are_generated(self):
+        image = Image.objects.create(status_message=self.status, image_file=png_upload((1600, 900)))
+        self.assertEqual(image.thumbnail_url, image.image_file.url)
+
+        process_images([image.pk])
+        image.refresh_from_db()
+        with image.thumbnail.open('rb') as f:
+            self.assertEqual(PILImage.open(f).size, (50, 50))
+        with image.web_image.open('rb') as f:
+            self.assertEqual(PILImage.open(f).size, (400, 225))
+        self.assertNotEqual(image.thumbnail_url, image.image_file.url)
+
+
+@override_settings(MINI_FB_FEED_FANOUT=True)
+class FanoutTimelineTests(TestCase):
+    ''' New statuses are written into the author's and friends' timelines, which follow friendship changes '''
+
+    def setUp(self):
+        cache.clear()
+        self.author, self.friend, self.stranger = make_profile('author'), make_profile('friend'), make_profile('stranger')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.add_friend(self.friend)
+
+    def post(self, profile, message):
+        status = StatusMessage.objects.create(profile=profile, message=message)
+        fan_out_status(status)
+        return status
+
+    def timeline(self, profile):
+        return set(TimelineEntry.objects.filter(owner=profile).values_list('status_message__message', flat=True))
+
+    def test_status_is_written_to_author_and_friends(self):
+        status = self.post(self.author, 'hello')
+        self.assertTrue(status.fanned_out)
+        self.assertEqual(self.timeline(self.author), {'hello'})
+        self.assertEqual(self.timeline(self.friend), {'hello'})
+        self.assertEqual(self.timeline(self.stranger), set())
+        self.assertEqual(list(self.friend.get_news_feed()), [status])
+
+    @override_settings(MINI_FB_TIMELINE_LENGTH=2)
+    def test_timelines_are_trimmed_oldest_first(self):
+        for message in ('one', 'two', 'three'):
+            self.post(self.author, message)
+        self.assertEqual(self.timeline(self.friend), {'two', 'three'})
+
+    def test_new_friend_is_backfilled_and_removed_friend_pruned(self):
+        self.post(self.author, 'before')
+        self.post(self.stranger, 'from stranger')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.add_friend(self.stranger)
+        self.assertEqual(self.timeline(self.stranger), {'before', 'from stranger'})
+        self.assertEqual(self.timeline(self.author), {'before', 'from stranger'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friend.objects.get(friend_1=self.author, friend_2=self.stranger).delete()
+        self.assertEqual(self.timeline(self.stranger), {'from stranger'})
+        self.assertEqual(self.timeline(self.author), {'before'})
+        self.assertEqual(self.timeline(self.friend), {'before'})
+
+    @override_settings(MINI_FB_FANOUT_MAX_FRIENDS=1)
+    def test_high_degree_authors_are_read_at_request_time(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.add_friend(self.stranger)
+        status = self.post(self.author, 'popular')
+        self.assertFalse(status.fanned_out)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(list(self.friend.get_news_feed()), [status])
+        self.assertEqual(list(self.stranger.get_news_feed()), [status])
+
+    def test_feed_merges_timeline_and_statuses_not_fanned_out(self):
+        start = timezone.now()
+        statuses = []
+        for i in range(6):
+            status = StatusMessage.objects.create(profile=self.author, message=f"status {i}", timestamp=start + timedelta(seconds=i))
+            # Every other status predates fan-out and is only found at read time
+            if i % 2:
+                fan_out_status(status)
+            statuses.append(status)
+
+        feed, cursor, pages = self.friend.get_news_feed(), None, []
+        while True:
+            page, cursor = paginate_statuses(feed, cursor, size=2)
+            pages.append(page)
+            if not cursor:
+                break
+        self.assertEqual(pages, [statuses[5:3:-1], statuses[3:1:-1], statuses[1::-1]])
+        self.assertEqual(statuses_since(feed, encode_cursor(statuses[3]))[0], statuses[4:])
+
+    def test_feed_reads_are_index_range_scans(self):
+        for i in range(3):
+            self.post(self.author, f"status {i}")
+        StatusMessage.objects.create(profile=self.author, message='not fanned out')
+        _, cursor = paginate_statuses(self.friend.get_news_feed(), size=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            paginate_statuses(self.friend.get_news_feed(), cursor, size=1)
+        plans = []
+        for query in queries:
+            if query['sql'].startswith('SELECT'):
+                with connection.cursor() as cursor:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans += [row[-1] for row in cursor.fetchall()]
+        self.assertIn('timeline_owner_timestamp_idx', ' '.join(plans))
+        self.assertFalse([plan for plan in plans if plan.startswith('SCAN')])
+
+
+class StatusCursorPageTests(TestCase):
+    ''' Status lists page by (timestamp, id) cursors '''
+
+    def setUp(self):
+        user = User.objects.create_user('viewer', password='password')
+        self.profile = make_profile('viewer', user=user)
+        self.client.force_login(user)
+        # Equal timestamps are ordered by id
+        timestamp = timezone.now()
+        self.statuses = [StatusMessage.objects.create(profile=self.profile, message=f"status {i}", timestamp=timestamp)
+                         for i in range(4)]
+
+    def test_pages_break_timestamp_ties_by_id(self):
+        first, cursor = paginate_statuses(self.profile.get_status_messages(), size=3)
+        second, last_cursor = paginate_statuses(self.profile.get_status_messages(), cursor, size=3)
+        self.assertEqual(first + second, self.statuses[::-1])
+        self.assertIsNone(last_cursor)
+
+    def test_full_last_page_has_no_next_cursor(self):
+        _, cursor = paginate_statuses(self.profile.get_status_messages(), size=2)
+        page, next_cursor = paginate_statuses(self.profile.get_status_messages(), cursor, size=2)
+        self.assertEqual(page, self.statuses[1::-1])
+        self.assertIsNone(next_cursor)
+
+    def test_cursor_seeks_the_index(self):
+        _, cursor = paginate_statuses(self.profile.get_status_messages(), size=2)
+        since = encode_cursor(self.statuses[1])
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            if 'FROM "mini_fb_statusmessage"' in sql:
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        # Keep the parameters bound, as the planner cannot use their values to narrow the OR
+        with connection.execute_wrapper(capture):
+            paginate_statuses(self.profile.get_status_messages(), cursor, size=2)
+            statuses_since(self.profile.get_status_messages(), since)
+        self.assertEqual(len(queries), 2)
+        for sql, params in queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            # The range scan starts at the cursor rather than walking every newer (or older) status
+            self.assertRegex(plan, r'status_profile_timestamp_idx \(profile_id=\? AND timestamp[<>]\?\)')
+
+    @override_settings(MINI_FB_PAGE_SIZE=3)
+    def test_page_endpoints(self):
+        url = reverse('status_messages_page', args=[self.profile.pk])
+        response = self.client.get(url)
+        response = self.client.get(url, {'cursor': str(response.context['next_cursor'])})
+        self.assertEqual(list(response.context['status_messages']), [self.statuses[0]])
+        # The context values are lazy, so compare what they wrap
+        self.assertFalse(response.context['next_cursor'])
+
+        response = self.client.get(reverse('news_feed_page'))
+        self.assertEqual(list(response.context['news_feed']), self.statuses[:0:-1])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('news_feed_page'), {'cursor': 'not-a-cursor'}).status_code, 400)
+
+
+class FriendSuggestionTests(TestCase):
+    ''' Suggestions rank friends of friends by mutual friends, city and friend count, then top up '''
+
+    def setUp(self):
+        cache.clear()
+
+    def make(self, name, city='Boston'):
+        profile = make_profile(name)
+        profile.city = city
+        profile.save()
+        return profile
+
+    def ranking(self, profile):
+        return [(p.first_name, p.mutual_friends) for p in profile.get_friend_suggestions()]
+
+    @override_settings(MINI_FB_SUGGESTIONS_LIMIT=6)
+    def test_ranking(self):
+        viewer, a, b = self.make('viewer'), self.make('a'), self.make('b')
+        x, y = self.make('x', 'Chicago'), self.make('y')
+        q, p, q_friend = self.make('q', 'Chicago'), self.make('p', 'Chicago'), self.make('q_friend', 'Chicago')
+        self.make('z')
+        self.make('w', 'Chicago')
+        with self.captureOnCommitCallbacks(execute=True):
+            for one, other in [(viewer, a), (viewer, b), (a, x), (b, x), (a, y), (b, q), (b, p), (q, q_friend)]:
+                one.add_friend(other)
+        self.assertEqual(self.ranking(viewer), [
+            ('x', 2),  # most mutual friends
+            ('y', 1),  # same city as the viewer
+            ('q', 1),  # more friends than p
+            ('p', 1),
+            ('z', 0),  # unconnected, same city first
+            ('q_friend', 0),
+        ])
+
+    def test_removed_friendship_invalidates_friends_of_both(self):
+        viewer, friend, other = self.make('viewer'), self.make('friend'), self.make('other')
+        with self.captureOnCommitCallbacks(execute=True):
+            viewer.add_friend(friend)
+            friend.add_friend(other)
+        self.assertEqual(self.ranking(viewer), [('other', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friend.objects.get(friend_1=friend, friend_2=other).delete()
+        self.assertEqual(self.ranking(viewer), [('other', 0)])
+
+    def test_suggestions_cached_before_commit_are_dropped(self):
+        viewer, friend, other = self.make('viewer'), self.make('friend'), self.make('other')
+        with self.captureOnCommitCallbacks(execute=True):
+            viewer.add_friend(friend)
+        with self.captureOnCommitCallbacks(execute=True):
+            friend.add_friend(other)
+            # A concurrent request reading the committed graph caches suggestions without the new friendship
+            cache.set(suggestions_cache_key(viewer.pk), [(other.pk, 0)])
+        self.assertEqual(self.ranking(viewer), [('other', 1)])
+
+
+class SeedFriendGraphTests(TestCase):
+    ''' seed_friend_graph bulk-loads edge lists and generated graphs '''
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_edges_are_canonical_and_distinct(self):
+        self.assertEqual(canonical_edges([(2, 1), (1, 2), (3, 3), ('4', '1')]), {(1, 2), (1, 4)})
+
+    def test_edge_list_formats(self):
+        csv_path = self.write('edges.csv', "friend_1,friend_2\n1,2\n3, 4\n")
+        jsonl_path = self.write('edges.jsonl', '[1, 2]\n\n{"friend_1": 3, "friend_2": 4}\n')
+        self.assertEqual(list(read_edges(csv_path)), [('1', '2'), ('3', ' 4')])
+        self.assertEqual(list(read_edges(jsonl_path)), [(1, 2), (3, 4)])
+
+    def test_load_edge_list(self):
+        a, b, c = make_profile('a'), make_profile('b'), make_profile('c')
+        a.add_friend(b)
+        path = self.write('edges.csv', f"{b.pk},{a.pk}\n{b.pk},{c.pk}\n{c.pk},999999\n{b.pk},{b.pk}\n")
+
+        out = StringIO()
+        call_command('seed_friend_graph', '--edges', path, stdout=out)
+        self.assertIn("Read 3 distinct edges", out.getvalue())
+        self.assertIn("Loaded 1 friendships", out.getvalue())
+        self.assertIn("(1 already existed, 1 skipped for unknown profiles)", out.getvalue())
+
+        self.assertEqual(list(c.get_friends()), [b])
+        b.refresh_from_db()
+        self.assertEqual(b.friend_count, 2)
+
+    def test_generate_graph(self):
+        call_command('seed_friend_graph', '--generate', '20', '--degree', '2', '--statuses', '1', '--seed', '1', stdout=StringIO())
+        self.assertEqual(Profile.objects.count(), 20)
+        self.assertEqual(Friend.objects.count(), 36)
+        self.assertEqual(FriendAdjacency.objects.count(), 72)
+        self.assertEqual(sum(Profile.objects.values_list('friend_count', flat=True)), 72)
+        self.assertEqual(set(Profile.objects.values_list('status_count', flat=True)), {1})
+
+    def test_generated_profiles_are_searchable(self):
+        call_command('seed_friend_graph', '--generate', '5', '--degree', '1', '--seed', '1', stdout=StringIO())
+        profile = Profile.objects.first()
+        self.assertEqual(profile.city_search, profile.city.lower())
+        self.assertIn(profile, search_profiles(f"{profile.first_name} {profile.last_name}"))
+
+
+class CreateProfileViewTests(TestCase):
+    ''' The sign-up page renders the profile and user forms together '''
+
+    def test_create_profile_page_loads(self):
+        response = self.client.get(reverse('create_profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('user_form', response.context)
+
+
+class ProfileFragmentCacheTests(TestCase):
+    ''' Unchanged profile pages are served from cached fragments '''
+
+    def setUp(self):
+        cache.clear()
+        self.profile = make_profile('owner')
+        self.friend = make_profile('friend')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.add_friend(self.friend)
+        StatusMessage.objects.create(profile=self.profile, message='first post')
+        self.url = reverse('show_profile', args=[self.profile.pk])
+
+    def test_unchanged_profile_only_loads_the_profile_row(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_changes_invalidate_the_fragments(self):
+        self.client.get(self.url)
+
+        StatusMessage.objects.create(profile=self.profile, message='second post')
+        self.assertContains(self.client.get(self.url), 'second post')
+
+        self.friend.first_name = 'Renamed'
+        self.friend.save()
+        self.assertContains(self.client.get(self.url), 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friend.objects.all().delete()
+        self.assertNotContains(self.client.get(self.url), 'Renamed')
+
+    def test_save_does_not_overwrite_cache_version(self):
+        stale = Profile.objects.get(pk=self.profile.pk)
+        StatusMessage.objects.create(profile=self.profile, message='bumps the version')
+        version = Profile.objects.get(pk=self.profile.pk).cache_version
+
+        stale.city = 'Cambridge'
+        stale.save()
+        self.assertGreater(Profile.objects.get(pk=self.profile.pk).cache_version, version)
+
+
+class DirectorySearchTests(TestCase):
+    ''' The directory searches name and city prefixes, case-insensitively '''
+
+    def setUp(self):
+        make_profile('Alice')
+        Profile.objects.create(first_name='Bob', last_name='Alvarez', city='Cambridge',
+                               email_address='bob@example.com', profile_image_url='https://example.com/b.jpg')
+        Profile.objects.create(first_name='Carol', last_name='Smith', city='Albany',
+                               email_address='carol@example.com', profile_image_url='https://example.com/c.jpg')
+
+    def search(self, query):
+        response = self.client.get(reverse('show_all_profiles'), {'q': query})
+        return [p.first_name for p in response.context['profiles']]
+
+    def test_prefix_matches_any_field(self):
+        self.assertEqual(self.search('al'), ['Bob', 'Carol', 'Alice'])
+        self.assertEqual(self.search('ALB'), ['Carol'])
+        self.assertEqual(self.search('al camb'), ['Bob'])
+        self.assertEqual(self.search('lice'), [])
+
+    def test_pages_past_the_count_cap_are_reachable(self):
+        for n in range(4):
+            make_profile(f"extra{n}")
+        paginator = CappedCountPaginator(Profile.objects.order_by('id'), 2)
+        paginator.count_cap = 3
+        self.assertTrue(paginator.is_capped)
+
+        names = []
+        page = paginator.page(1)
+        while True:
+            names += [p.first_name for p in page]
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_page_number())
+        self.assertEqual(names, list(Profile.objects.order_by('id').values_list('first_name', flat=True)))
+        self.assertEqual((page.number, page.start_index(), page.end_index()), (4, 7, 7))
+        with self.assertRaises(EmptyPage):
+            paginator.page(5)
+
+    def test_search_columns_follow_updates(self):
+        profile = Profile.objects.get(first_name='Carol')
+        profile.city = 'Boston'
+        profile.save(update_fields=['city'])
+        self.assertEqual(self.search('albany'), [])
+        self.assertEqual(self.search('bost'), ['Carol', 'Alice'])
+
+
+@tag('benchmark')
+@skipUnless(os.environ.get('MINI_FB_BENCHMARKS'), "set MINI_FB_BENCHMARKS=1 to run the view benchmarks")
+class ViewBenchmarkTests(TestCase):
+    ''' Query-count and latency benchmarks for the main views.
+
+    The graph shape comes from MINI_FB_BENCH_PROFILES, MINI_FB_BENCH_DEGREE,
+    MINI_FB_BENCH_STATUSES, MINI_FB_BENCH_IMAGES and MINI_FB_BENCH_REPEAT.
+    MINI_FB_BENCH_REPORT names a JSON file to write the results to. With
+    MINI_FB_BENCH_BASELINE set to an earlier report, the test fails when a view
+    runs more queries, or its p95 latency grows by more than
+    MINI_FB_BENCH_LATENCY_THRESHOLD (default 0.5, i.e. 50%). The suite is
+    skipped unless MINI_FB_BENCHMARKS is set; run it on its own with
+    MINI_FB_BENCHMARKS=1 python manage.py test mini_fb --tag benchmark.
+    '''
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views(self):
+        env = os.environ.get
+        graph = {
+            'profiles': int(env('MINI_FB_BENCH_PROFILES', 100)),
+            'degree': int(env('MINI_FB_BENCH_DEGREE', 4)),
+            'statuses_per_profile': int(env('MINI_FB_BENCH_STATUSES', 3)),
+            'images_per_status': int(env('MINI_FB_BENCH_IMAGES', 1)),
+        }
+        viewer = benchmarks.seed_graph(**graph)
+        report = benchmarks.run_benchmarks(self.client, viewer, repeat=int(env('MINI_FB_BENCH_REPEAT', 10)))
+        report['graph'] = graph
+
+        if env('MINI_FB_BENCH_REPORT'):
+            benchmarks.write_report(report, env('MINI_FB_BENCH_REPORT'))
+        if env('MINI_FB_BENCH_BASELINE'):
+            regressions = benchmarks.find_regressions(
+                report, benchmarks.read_report(env('MINI_FB_BENCH_BASELINE')),
+                latency_threshold=float(env('MINI_FB_BENCH_LATENCY_THRESHOLD', 0.5)),
+            )
+            self.assertEqual(regressions, [])
+
+        # Warm profile pages come from the fragment cache
+        self.assertLess(
+            report['views']['ShowProfilePageView']['warm']['queries'],
+            report['views']['ShowProfilePageView']['cold']['queries'],
+        )
+
+
+@override_settings(MINI_FB_LIVE_FEED=True)
+class LiveFeedTests(TestCase):
+    ''' New statuses are published to the author's and friends' live feeds '''
+
+    def setUp(self):
+        cache.clear()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    async def subscribe(self, profile):
+        return get_broker().subscribe(profile.pk)
+
+    def test_status_is_published_to_friends(self):
+        author, friend, stranger = make_profile('author'), make_profile('friend'), make_profile('stranger')
+        with self.captureOnCommitCallbacks(execute=True):
+            author.add_friend(friend)
+        friend_feed = self.loop.run_until_complete(self.subscribe(friend))
+        stranger_feed = self.loop.run_until_complete(self.subscribe(stranger))
+        self.addCleanup(friend_feed.close)
+        self.addCleanup(stranger_feed.close)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            status = StatusMessage.objects.create(profile=author, message='live')
+
+        self.assertEqual(self.loop.run_until_complete(friend_feed.next(timeout=1)), status.pk)
+        self.assertIsNone(self.loop.run_until_complete(stranger_feed.next(timeout=0.01)))
+
+    @override_settings(MINI_FB_LIVE_FEED=False)
+    def test_stream_is_off_by_default(self):
+        user = User.objects.create_user('viewer', password='password')
+        make_profile('viewer', user=user)
+        self.client.force_login(user)
+        self.assertNotContains(self.client.get(reverse('show_news_feed')), 'data-stream-url')
+        self.assertEqual(self.client.get(reverse('news_feed_stream')).status_code, 404)
+
+    def test_items_endpoint_only_returns_the_viewers_feed(self):
+        user = User.objects.create_user('viewer', password='password')
+        viewer, stranger = make_profile('viewer', user=user), make_profile('stranger')
+        own = StatusMessage.objects.create(profile=viewer, message='mine')
+        other = StatusMessage.objects.create(profile=stranger, message='not in my feed')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('news_feed_items'), {'ids': f"{own.pk},{other.pk}"})
+        self.assertEqual(list(response.context['news_feed']), [own])
+
+
+@override_settings(MINI_FB_LIVE_FEED=True)
+class LiveFeedStreamTests(TestCase):
+    ''' The event stream forwards published status ids to the viewer '''
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', password='password')
+        self.viewer = make_profile('viewer', user=self.user)
+
+    def test_news_feed_links_the_stream(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('show_news_feed')), reverse('news_feed_stream'))
+
+    async def test_stream_sends_published_statuses(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('news_feed_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b"retry: 5000\n\n")
+        # The subscription exists once the first chunk has been sent
+        get_broker().publish([self.viewer.pk], 42)
+        self.assertIn(b"data: 42", await anext(chunks))
+        await chunks.aclose()
+
+
+class NewsFeedSinceTests(TestCase):
+    ''' The JSON feed returns newer statuses and answers unchanged polls with 304 '''
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('viewer', password='password')
+        self.viewer, self.friend = make_profile('viewer', user=user), make_profile('friend')
+        self.viewer.add_friend(self.friend)
+        self.first = StatusMessage.objects.create(profile=self.friend, message='first')
+        self.client.force_login(user)
+
+    def poll(self, since=None, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse('news_feed_since'), {'since': since} if since else {}, headers=headers)
+
+    def test_returns_statuses_after_the_cursor(self):
+        cursor = self.poll().json()['cursor']
+        second = StatusMessage.objects.create(profile=self.friend, message='second')
+
+        data = self.poll(cursor).json()
+        self.assertEqual([status['id'] for status in data['statuses']], [second.pk])
+        self.assertEqual(self.poll(data['cursor']).json()['statuses'], [])
+
+    def test_unchanged_feed_is_not_modified_without_status_queries(self):
+        response = self.poll()
+        cursor, etag = response.json()['cursor'], response['ETag']
+        response = self.poll(cursor)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.poll(cursor, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries if 'mini_fb_statusmessage' in q['sql']])
+
+        # A friend's new status changes the viewer's feed version
+        StatusMessage.objects.create(profile=self.friend, message='second')
+        self.assertEqual(self.poll(cursor, etag).status_code, 200)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.poll('not-a-cursor').status_code, 400)
+
+
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    ''' Status images can be uploaded in resumable chunks and attached to a status '''
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('uploader', password='password')
+        self.profile = make_profile('uploader', user=user)
+        self.client.force_login(user)
+        self.data = png_bytes((64, 64), 'blue')
+
+    def send(self, upload, offset, chunk):
+        return self.client.put(upload['url'], chunk, content_type='application/octet-stream',
+                               headers={'Upload-Offset': str(offset)})
+
+    def test_upload_resumes_and_attaches(self):
+        upload = self.client.post(reverse('start_upload'), {'filename': 'photo.png', 'size': len(self.data)}).json()
+        half = len(self.data) // 2
+        self.assertEqual(self.send(upload, 0, self.data[:half]).json()['offset'], half)
+
+        # A client that lost track resends from the start, is told the offset and resumes there
+        response = self.send(upload, 0, self.data)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, half))
+        self.assertEqual(self.client.get(upload['url']).json()['offset'], half)
+        self.assertTrue(self.send(upload, half, self.data[half:]).json()['complete'])
+
+        status = StatusMessage.objects.create(profile=self.profile, message='photo')
+        images = Image.objects.bulk_create(attach_uploads(status, [upload['id'], 'not-a-uuid']))
+        with images[0].image_file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_stale_uploads_are_deleted_with_their_files(self):
+        upload = self.client.post(reverse('start_upload'), {'filename': 'photo.png', 'size': len(self.data)}).json()
+        path = upload_path(ChunkedUpload.objects.get(pk=upload['id']))
+        self.assertEqual(delete_stale_uploads(timedelta(hours=1)), 0)
+        self.assertEqual(delete_stale_uploads(timedelta(0)), 1)
+        self.assertFalse(os.path.exists(path))
+
+
+class ContentAddressedImageTests(TemporaryMediaMixin, TestCase):
+    ''' Identical image files are stored once and deleted with their last reference '''
+
+    def setUp(self):
+        super().setUp()
+        self.profile = make_profile('author')
+
+    def post(self, color):
+        status = StatusMessage.objects.create(profile=self.profile, message=color)
+        return status, Image.objects.create(status_message=status, image_file=png_upload(color=color))
+
+    def test_files_are_shared_until_the_last_reference_goes(self):
+        first_status, first = self.post('red')
+        second_status, second = self.post('red')
+        _, other = self.post('green')
+        self.assertEqual(first.image_file.name, second.image_file.name)
+        self.assertNotEqual(first.image_file.name, other.image_file.name)
+        self.assertEqual(StoredFile.objects.get(name=first.image_file.name).ref_count, 2)
+
+        path = first.image_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first_status.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second_status.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(StoredFile.objects.filter(name=first.image_file.name).exists())
+
+    def test_edited_image_moves_its_references(self):
+        _, image = self.post('red')
+        other_status, other = self.post('green')
+        red_path = image.image_file.path
+
+        # As the admin does when a new file is chosen
+        image.image_file = png_upload(color='green')
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertEqual(image.image_file.name, other.image_file.name)
+        self.assertFalse(os.path.exists(red_path))
+        self.assertEqual(StoredFile.objects.get(name=other.image_file.name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other_status.delete()
+        self.assertTrue(os.path.exists(image.image_file.path))
+
+    def test_repair_recounts_references(self):
+        _, image = self.post('red')
+        StoredFile.objects.all().delete()
+        call_command('repair_file_refs', stdout=StringIO())
+        self.assertEqual(StoredFile.objects.get(name=image.image_file.name).ref_count, 1)
@@ -0,0 +1,167 @@
+''' Fan-out-on-write news feed timelines for mini_fb.
+
+When MINI_FB_FEED_FANOUT is enabled, a new status is pushed into a bounded
+TimelineEntry list for its author and each of the author's friends, so reading
+a feed is a range scan on one profile's timeline. Authors with more than
+MINI_FB_FANOUT_MAX_FRIENDS friends are not fanned out; their statuses keep
+fanned_out=False and are picked up at read time instead.
+'''
+import heapq
+import itertools
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import StatusMessage, TimelineEntry
+
+
+def fanout_enabled():
+    ''' Returns True when news feeds are served from the fan-out timelines '''
+    return getattr(settings, 'MINI_FB_FEED_FANOUT', False)
+
+
+def timeline_length():
+    ''' Maximum number of entries kept per timeline '''
+    return getattr(settings, 'MINI_FB_TIMELINE_LENGTH', 500)
+
+
+def max_fanout_friends():
+    ''' Friend count above which an author's statuses are read at request time instead '''
+    return getattr(settings, 'MINI_FB_FANOUT_MAX_FRIENDS', 1000)
+
+
+def trim_timelines(owner_ids):
+    ''' Deletes the entries of each timeline past timeline_length(), oldest first '''
+    overflow = (
+        TimelineEntry.objects.filter(owner_id__in=owner_ids)
+        .annotate(position=Window(RowNumber(), partition_by=F('owner_id'), order_by=F('timestamp').desc()))
+        .filter(position__gt=timeline_length())
+        .values_list('id', flat=True)
+    )
+    overflow_ids = list(overflow)
+    if overflow_ids:
+        TimelineEntry.objects.filter(id__in=overflow_ids).delete()
+
+
+def fan_out_status(status):
+    ''' Pushes a newly created status into its author's and its author's friends' timelines '''
+    if not fanout_enabled():
+        return
+
+    friend_ids = status.profile.get_friend_ids()
+    # Fall back to fan-out-on-read for high-degree authors
+    if len(friend_ids) > max_fanout_friends():
+        return
+
+    owner_ids = [status.profile_id, *friend_ids]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=owner_id, status_message=status, timestamp=status.timestamp) for owner_id in owner_ids],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    StatusMessage.objects.filter(pk=status.pk).update(fanned_out=True)
+    status.fanned_out = True
+    trim_timelines(owner_ids)
+
+
+def backfill_friendship(profile, other):
+    ''' Copies each profile's recent fanned-out statuses into the other's timeline after they become friends '''
+    if not fanout_enabled():
+        return
+
+    entries = []
+    for owner, author in ((profile, other), (other, profile)):
+        recent = (
+            StatusMessage.objects.filter(profile=author, fanned_out=True)
+            .order_by('-timestamp')
+            .values_list('id', 'timestamp')[:timeline_length()]
+        )
+        entries += [TimelineEntry(owner=owner, status_message_id=pk, timestamp=timestamp) for pk, timestamp in recent]
+    TimelineEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+    trim_timelines([profile.pk, other.pk])
+
+
+def remove_friendship(profile_id, other_id):
+    ''' Removes each profile's statuses from the other's timeline after they stop being friends '''
+    TimelineEntry.objects.filter(
+        Q(owner_id=profile_id, status_message__profile_id=other_id)
+        | Q(owner_id=other_id, status_message__profile_id=profile_id)
+    ).delete()
+
+
+# StatusMessage fields that TimelineEntry mirrors, so filters on them can use the owner index
+ENTRY_FIELDS = {'timestamp': 'timestamp', 'id': 'status_message_id', 'pk': 'status_message_id'}
+
+
+def entry_lookup(lookup):
+    ''' Translates a StatusMessage lookup or ordering into the matching TimelineEntry one '''
+    sign, lookup = ('-', lookup[1:]) if lookup.startswith('-') else ('', lookup)
+    field, sep, rest = lookup.partition('__')
+    if field in ENTRY_FIELDS:
+        return f"{sign}{ENTRY_FIELDS[field]}{sep}{rest}"
+    return f"{sign}status_message__{lookup}"
+
+
+def entry_q(q):
+    ''' Translates a Q object on StatusMessage into the matching Q object on TimelineEntry '''
+    translated = Q()
+    translated.connector, translated.negated = q.connector, q.negated
+    translated.children = [
+        entry_q(child) if isinstance(child, Q) else (entry_lookup(child[0]), child[1])
+        for child in q.children
+    ]
+    return translated
+
+
+class Timeline:
+    ''' News feed of a profile: its timeline entries merged with the statuses that were not fanned out.
+
+    The two parts are read as separate queries, each a range scan on its own
+    index (timeline_owner_timestamp_idx and status_not_fanned_out_idx), and
+    their ordered results are merged. It supports the part of the QuerySet API
+    the feed views use: filter(), order_by(), slicing and iteration.
+    '''
+
+    def __init__(self, entries, fallback, ordering=('-timestamp', '-id')):
+        self.entries = entries
+        self.fallback = fallback
+        self.ordering = ordering
+
+    def filter(self, *args, **kwargs):
+        q = Q(*args, **kwargs)
+        return Timeline(self.entries.filter(entry_q(q)), self.fallback.filter(q), self.ordering)
+
+    def order_by(self, *fields):
+        return Timeline(self.entries, self.fallback, fields)
+
+    def _merge(self, limit=None):
+        entries = self.entries.order_by(*[entry_lookup(field) for field in self.ordering])
+        fallback = self.fallback.order_by(*self.ordering)
+        if limit is not None:
+            entries, fallback = entries[:limit], fallback[:limit]
+        return heapq.merge(
+            (entry.status_message for entry in entries), fallback,
+            key=lambda status: (status.timestamp, status.pk), reverse=self.ordering[0].startswith('-'),
+        )
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice) or k.step is not None:
+            raise TypeError('Timeline only supports slices without a step')
+        return list(itertools.islice(self._merge(k.stop), k.start, k.stop))
+
+    def __iter__(self):
+        return self._merge()
+
+
+def get_timeline(profile):
+    ''' Returns the news feed of a profile from its timeline plus any statuses that were not fanned out '''
+    entries = (
+        TimelineEntry.objects.filter(owner=profile)
+        .select_related('status_message__profile').prefetch_related('status_message__images')
+    )
+    fallback = (
+        StatusMessage.objects.filter(profile_id__in=profile.get_friend_ids() | {profile.pk}, fanned_out=False)
+        .select_related('profile').prefetch_related('images')
+    )
+    return Timeline(entries, fallback)
@@ -0,0 +1,136 @@
+''' Chunked, resumable uploads of status images.
+
+A client starts an upload with the file's name and size, then sends the file in
+chunks, each starting at the offset the server has recorded. After a dropped
+connection it asks for the offset and resumes from there. Chunks are bounded by
+MINI_FB_UPLOAD_CHUNK_SIZE, so no single request holds a worker for the whole
+transfer. Completed uploads are attached to a status message as Images.
+'''
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import ChunkedUpload, Image
+
+# Bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+
+
+class UploadOffsetError(ValueError):
+    ''' A chunk did not start at the upload's current offset '''
+
+    def __init__(self, offset):
+        super().__init__(f"Chunk must start at offset {offset}")
+        self.offset = offset
+
+
+class AssembledFile(File):
+    ''' A completed upload. FileSystemStorage moves files with a temporary_file_path instead of copying them. '''
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def chunk_dir():
+    ''' Directory holding the partial files of uploads in progress '''
+    return getattr(settings, 'MINI_FB_CHUNK_DIR', os.path.join(settings.MEDIA_ROOT, 'chunks'))
+
+
+def max_upload_size():
+    return getattr(settings, 'MINI_FB_MAX_UPLOAD_SIZE', 20 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'MINI_FB_UPLOAD_CHUNK_SIZE', 2 * 1024 * 1024)
+
+
+def upload_path(upload):
+    ''' Path of the partial file of an upload '''
+    return os.path.join(chunk_dir(), f"{upload.pk}.part")
+
+
+def start_upload(profile, filename, size):
+    ''' Creates an upload of size bytes and its empty partial file. Raises ValueError on a bad name or size. '''
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise ValueError("A filename is required")
+    if not 0 < size <= max_upload_size():
+        raise ValueError(f"Size must be between 1 and {max_upload_size()} bytes")
+
+    upload = ChunkedUpload.objects.create(profile=profile, filename=filename[:255], size=size)
+    os.makedirs(chunk_dir(), exist_ok=True)
+    open(upload_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    ''' Writes up to length bytes from stream at offset and returns the new offset.
+
+    Whatever arrives before the stream ends is kept, so a dropped connection
+    only loses the unsent part of a chunk. Raises UploadOffsetError when offset
+    is not the upload's current offset and ValueError when the chunk is too big.
+    '''
+    if offset != upload.offset:
+        raise UploadOffsetError(upload.offset)
+    if length > max_chunk_size() or offset + length > upload.size:
+        raise ValueError(f"Chunks are limited to {max_chunk_size()} bytes and must not pass the end of the file")
+
+    written = 0
+    with open(upload_path(upload), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+
+    # Only advance from the offset this chunk started at; a concurrent chunk for
+    # the same offset loses and is told where the upload now stands
+    advanced = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(
+        offset=offset + written, updated=timezone.now()
+    )
+    if not advanced:
+        upload.refresh_from_db(fields=['offset'])
+        raise UploadOffsetError(upload.offset)
+    upload.offset = offset + written
+    return upload.offset
+
+
+def attach_uploads(status_message, upload_ids):
+    ''' Moves the completed uploads of the status's author into image storage.
+
+    Returns unsaved Images for status_message, so the caller can insert them
+    together with any other images. Unknown or incomplete uploads are ignored.
+    '''
+    field = Image._meta.get_field('image_file')
+    valid_ids = []
+    for upload_id in upload_ids:
+        try:
+            valid_ids.append(uuid.UUID(str(upload_id)))
+        except ValueError:
+            continue
+    uploads = ChunkedUpload.objects.filter(profile_id=status_message.profile_id, pk__in=valid_ids)
+
+    images = []
+    for upload in uploads:
+        if not upload.is_complete:
+            continue
+        path = upload_path(upload)
+        with open(path, 'rb') as f:
+            name = field.storage.save(
+                field.generate_filename(None, upload.filename), AssembledFile(f, name=upload.filename),
+                max_length=field.max_length,
+            )
+        images.append(Image(status_message=status_message, image_file=name))
+        upload.delete()
+    return images
+
+
+def delete_stale_uploads(max_age):
+    ''' Deletes uploads not written to for max_age (a timedelta) and returns how many there were '''
+    deleted, _ = ChunkedUpload.objects.filter(updated__lt=timezone.now() - max_age).delete()
+    return deleted
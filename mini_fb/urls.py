@@ -9,6 +9,8 @@ urlpatterns = [
    path('', views.ShowAllProfilesView.as_view(), name='show_all_profiles'),
    # Class based view to search based on path query parameters for a specific profile
    path('profile/<int:pk>', views.ShowProfilePageView.as_view(), name='show_profile'),
+   # Next page of a profile's status messages as an HTML fragment, by ?cursor=
+   path('profile/<int:pk>/status_messages', views.ShowStatusMessagesPageView.as_view(), name='status_messages_page'),
    # Class based view to create a new profile
     path('create_profile', views.CreateProfileView.as_view(), name='create_profile'),
      # Class based view to create a new status message
@@ -24,6 +26,16 @@ urlpatterns = [
     path('profile/friend_suggestions/', views.ShowFriendSuggestionsView.as_view(), name='friend_suggestions'),
     # Show newsfeed
       path('profile/news_feed', views.ShowNewsFeedView.as_view(), name='show_news_feed'),
+    # Next page of the news feed as an HTML fragment, by ?cursor=
+    path('profile/news_feed/page', views.ShowNewsFeedPageView.as_view(), name='news_feed_page'),
+    # Live news feed: event stream of new status ids, and the items for those ids
+    path('profile/news_feed/stream', views.NewsFeedStreamView.as_view(), name='news_feed_stream'),
+    path('profile/news_feed/items', views.ShowNewsFeedItemsView.as_view(), name='news_feed_items'),
+    # JSON news feed statuses newer than ?since=, for polling clients
+    path('profile/news_feed/since', views.NewsFeedSinceView.as_view(), name='news_feed_since'),
+    # Chunked, resumable status image uploads
+    path('profile/uploads', views.StartUploadView.as_view(), name='start_upload'),
+    path('profile/uploads/<uuid:pk>', views.UploadDetailView.as_view(), name='upload_detail'),
       
       
     # Require user login
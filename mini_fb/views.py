@@ -1,19 +1,63 @@
+import hashlib
+
 from django.shortcuts import render, get_object_or_404, redirect
+from django.core.exceptions import BadRequest
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
 from django.views import View
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth import login
-from .models import Profile, StatusMessage, Image
-from .forms import CreateProfileForm, CreateStatusMessageForm, UpdateProfileForm
 from django.contrib.auth.forms import UserCreationForm
+from .models import ChunkedUpload, Profile, StatusMessage, Image, add_file_refs, bump_status_versions
+from .forms import CreateProfileForm, CreateStatusMessageForm, UpdateProfileForm
+from .timeline import fan_out_status
+from .pagination import CappedCountPaginator, decode_cursor, paginate_statuses, statuses_since
+from .search import search_profiles
+from .live import event_stream, live_feed_enabled
+from .images import process_images
+from .uploads import UploadOffsetError, attach_uploads, start_upload, write_chunk
+
+
+class StatusPageMixin:
+    ''' Paginates status messages by the opaque ?cursor= query parameter '''
+
+    def get_status_page(self, queryset):
+        ''' Returns (statuses, next_cursor) as lazy objects, so the query only runs if the page is rendered '''
+        cursor = self.request.GET.get('cursor')
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise BadRequest('Invalid cursor')
+        page = SimpleLazyObject(lambda: paginate_statuses(queryset, cursor))
+        return SimpleLazyObject(lambda: page[0]), SimpleLazyObject(lambda: page[1])
+
 # Views that don't require login
 class ShowAllProfilesView(ListView):
     model = Profile
     template_name = 'mini_fb/show_all_profiles.html'
     context_object_name = 'profiles'
+    paginate_by = 25
+    paginator_class = CappedCountPaginator
 
-class ShowProfilePageView(DetailView):
+    def get_queryset(self):
+        # Prefix search on first name, last name and city by ?q=
+        self.query = self.request.GET.get('q', '').strip()
+        # Order by name, recent activity or friend count by ?sort=
+        self.sort = self.request.GET.get('sort', 'name')
+        return search_profiles(self.query, self.sort)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        context['sort'] = self.sort
+        return context
+
+class ShowProfilePageView(StatusPageMixin, DetailView):
     model = Profile
     template_name = 'mini_fb/show_profile.html'
     context_object_name = 'profile'
@@ -21,10 +65,19 @@ class ShowProfilePageView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         profile = self.object
-        context['status_messages'] = profile.get_status_messages()
+        context['status_messages'], context['next_cursor'] = self.get_status_page(profile.get_status_messages())
+        # Cached fragments are keyed by profile.cache_version and whether the viewer owns the profile
+        context['is_owner'] = self.request.user.is_authenticated and profile.user_id == self.request.user.pk
+        context['cursor'] = self.request.GET.get('cursor', '')
+        context['fragment_cache_timeout'] = getattr(settings, 'MINI_FB_FRAGMENT_CACHE_TIMEOUT', 60 * 60)
         return context
 
 
+class ShowStatusMessagesPageView(ShowProfilePageView):
+    ''' Renders the next page of a profile's status messages as an HTML fragment for "load more" '''
+    template_name = 'mini_fb/status_message_items.html'
+
+
 class CreateProfileView(CreateView):
     model = Profile
     form_class = CreateProfileForm
@@ -80,10 +133,20 @@ class CreateStatusMessageView(LoginRequiredMixin, CreateView):
         
         sm = form.save()
         files = self.request.FILES.getlist('files')
-        
-        for f in files:
-            img = Image(status_message=sm, image_file=f)
-            img.save()
+
+        # Insert all image rows at once, including completed chunked uploads;
+        # thumbnails are generated in the background
+        images = [Image(status_message=sm, image_file=f) for f in files]
+        images += attach_uploads(sm, self.request.POST.getlist('uploads'))
+        images = Image.objects.bulk_create(images)
+        # bulk_create sends no signals, so count the file references and
+        # invalidate the cached profile page here
+        add_file_refs(name for img in images for name in img.file_names())
+        bump_status_versions(sm.pk)
+        process_images(img.pk for img in images)
+
+        # Push the new status into the friends' news feed timelines
+        fan_out_status(sm)
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -137,7 +200,7 @@ class ShowFriendSuggestionsView(LoginRequiredMixin, DetailView):
     def get_object(self, queryset=None):
         return get_object_or_404(Profile, user=self.request.user)
 
-class ShowNewsFeedView(LoginRequiredMixin, DetailView):
+class ShowNewsFeedView(LoginRequiredMixin, StatusPageMixin, DetailView):
     model = Profile
     template_name = 'mini_fb/news_feed.html'
     context_object_name = 'profile'
@@ -145,8 +208,154 @@ class ShowNewsFeedView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        profile = self.get_object()
-        context['news_feed'] = profile.get_news_feed()
+        profile = self.object
+        context['news_feed'], context['next_cursor'] = self.get_status_page(profile.get_news_feed())
+        context['live_feed'] = live_feed_enabled()
         return context
     def get_object(self, queryset=None):
-        return get_object_or_404(Profile, user=self.request.user)
\ No newline at end of file
+        return get_object_or_404(Profile, user=self.request.user)
+
+
+class ShowNewsFeedPageView(ShowNewsFeedView):
+    ''' Renders the next page of the news feed as an HTML fragment for "load more" '''
+    template_name = 'mini_fb/news_feed_items.html'
+
+
+class ShowNewsFeedItemsView(ShowNewsFeedView):
+    ''' Renders the given ?ids= of the viewer's news feed as an HTML fragment, for live updates '''
+    template_name = 'mini_fb/news_feed_items.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        ids = [pk for pk in self.request.GET.get('ids', '').split(',') if pk.isdigit()]
+        context['news_feed'] = self.object.get_news_feed().filter(id__in=ids)
+        context['next_cursor'] = None
+        return context
+
+
+class NewsFeedStreamView(View):
+    ''' Server-sent events stream of new status ids for the logged in viewer's news feed. Needs ASGI. '''
+
+    async def get(self, request):
+        if not live_feed_enabled():
+            return HttpResponse(status=404)
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponse(status=401)
+        profile = await Profile.objects.filter(user=user).afirst()
+        if profile is None:
+            return HttpResponse(status=404)
+
+        response = StreamingHttpResponse(event_stream(profile.pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop proxies such as nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def news_feed_etag(request, *args, **kwargs):
+    ''' ETag of the viewer's news feed for the requested ?since= cursor. Reads only the Profile row. '''
+    if not request.user.is_authenticated:
+        return None
+    version = Profile.objects.filter(user=request.user).values_list('pk', 'feed_version').first()
+    if version is None:
+        return None
+    since = hashlib.md5(request.GET.get('since', '').encode()).hexdigest()[:16]
+    return '{}-{}-{}'.format(*version, since)
+
+
+def status_as_json(status):
+    ''' JSON representation of a status message with its author and images '''
+    return {
+        'id': status.pk,
+        'message': status.message,
+        'timestamp': status.timestamp.isoformat(),
+        'profile': {
+            'id': status.profile.pk,
+            'first_name': status.profile.first_name,
+            'last_name': status.profile.last_name,
+            'profile_image_url': status.profile.profile_image_url,
+        },
+        'images': [
+            {'url': image.image_file.url, 'thumbnail_url': image.thumbnail_url, 'web_image_url': image.web_image_url}
+            for image in status.images.all()
+        ],
+    }
+
+
+@method_decorator(condition(etag_func=news_feed_etag), name='get')
+class NewsFeedSinceView(LoginRequiredMixin, View):
+    ''' JSON list of the viewer's news feed statuses newer than the ?since= cursor, oldest first.
+
+    Responses carry an ETag built from the profile's feed_version, so polling an
+    unchanged feed with If-None-Match gets a 304 without querying the statuses.
+    '''
+    login_url = 'login'
+
+    def get(self, request):
+        profile = get_object_or_404(Profile, user=request.user)
+        try:
+            statuses, cursor, has_more = statuses_since(profile.get_news_feed(), request.GET.get('since'))
+        except ValueError:
+            raise BadRequest('Invalid cursor')
+        response = JsonResponse({
+            'statuses': [status_as_json(status) for status in statuses],
+            'cursor': cursor,
+            'has_more': has_more,
+        })
+        # Clients must revalidate, which is cheap while the feed is unchanged
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def upload_as_json(upload):
+    return {
+        'id': str(upload.pk),
+        'url': reverse('upload_detail', kwargs={'pk': upload.pk}),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'complete': upload.is_complete,
+    }
+
+
+class StartUploadView(LoginRequiredMixin, View):
+    ''' Starts a chunked upload of a status image from the POSTed filename and size '''
+    login_url = 'login'
+
+    def post(self, request):
+        profile = get_object_or_404(Profile, user=request.user)
+        try:
+            upload = start_upload(profile, request.POST.get('filename'), int(request.POST.get('size', '')))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(upload_as_json(upload), status=201)
+
+
+class UploadDetailView(LoginRequiredMixin, View):
+    ''' GET reports how much of an upload has arrived; PUT appends the request body at the Upload-Offset header.
+
+    A chunk that does not start at the current offset gets a 409 with the offset
+    to resume from. Once the offset reaches the size, the upload id can be posted
+    with a new status message as "uploads".
+    '''
+    login_url = 'login'
+
+    def get_upload(self):
+        return get_object_or_404(ChunkedUpload, pk=self.kwargs['pk'], profile__user=self.request.user)
+
+    def get(self, request, pk):
+        return JsonResponse(upload_as_json(self.get_upload()))
+
+    def put(self, request, pk):
+        upload = self.get_upload()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+            write_chunk(upload, offset, request, length)
+        except UploadOffsetError as e:
+            upload.offset = e.offset
+            return JsonResponse(upload_as_json(upload), status=409)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(upload_as_json(upload))
@@ -0,0 +1,38 @@
+/* mini_fb.js */
+
+/* "Load more" links fetch the next page as an HTML fragment and replace themselves with it.
+   Without JavaScript the link falls back to the full page at the same cursor. */
+document.addEventListener('click', function (event) {
+    var link = event.target.closest('a.load-more');
+    if (!link) {
+        return;
+    }
+    event.preventDefault();
+    fetch(link.dataset.fragmentUrl, { credentials: 'same-origin' })
+        .then(function (response) { return response.text(); })
+        .then(function (html) { link.parentElement.outerHTML = html; });
+});
+
+/* Live news feed: listen for new status ids and prepend their rendered items. */
+document.addEventListener('DOMContentLoaded', function () {
+    var feed = document.querySelector('.live-feed');
+    // The server only gives a stream url when it runs under ASGI
+    if (!feed || !feed.dataset.streamUrl || !window.EventSource) {
+        return;
+    }
+    var pending = [];
+    var source = new EventSource(feed.dataset.streamUrl);
+    source.addEventListener('status', function (event) {
+        pending.push(event.data);
+        // Several statuses arriving together are fetched in one request
+        if (pending.length === 1) {
+            setTimeout(function () {
+                var ids = pending.join(',');
+                pending = [];
+                fetch(feed.dataset.itemsUrl + '?ids=' + ids, { credentials: 'same-origin' })
+                    .then(function (response) { return response.text(); })
+                    .then(function (html) { feed.insertAdjacentHTML('afterbegin', html); });
+            }, 250);
+        }
+    });
+});
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VoterAnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'voter_analytics'
+
+    def ready(self):
+        # Registers the deploy checks and the cube's signal handlers
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,81 @@
+''' Figures for the voter graphs page.
+
+The page loads plotly.js once, as a static file, and draws the figures from
+their JSON. That JSON is cached per normalized filter and data version, so a
+repeated filter costs one cache read.
+'''
+import hashlib
+import json
+
+import plotly.graph_objects as go
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from .cube import cube_totals, data_version
+from .filters import filter_cube
+
+# Escapes that keep JSON from closing or confusing the <script> element it is embedded in
+SCRIPT_ESCAPES = {ord('<'): '\\u003C', ord('>'): '\\u003E', ord('&'): '\\u0026'}
+
+
+def build_figures(by_year, by_party, by_election):
+    ''' Returns the page's figures by element id, from the cube totals '''
+    # Histogram for voter distribution by year of birth
+    birth_year_hist = go.Figure(data=[go.Histogram(
+        x=list(by_year), y=list(by_year.values()), histfunc='sum',
+        nbinsx=50, xbins=dict(start=1900, end=2024, size=1))])
+    birth_year_hist.update_layout(
+        title='Voter Distribution by Year of Birth',
+        xaxis_title='Year of Birth',
+        yaxis_title='Number of Voters',
+        bargap=0.1
+    )
+
+    # Pie chart for voter distribution by party affiliation
+    party_affiliation_pie = go.Figure(data=[go.Pie(labels=list(by_party), values=list(by_party.values()))])
+    party_affiliation_pie.update_layout(
+        title='Voter Distribution by Party Affiliation',
+        legend_title='Party Affiliation'
+    )
+
+    # Bar chart for voter participation by election
+    election_participation_hist = go.Figure(data=[go.Bar(
+        x=list(by_election), y=list(by_election.values()),
+        text=[f'{value:,.0f}' for value in by_election.values()])])
+    election_participation_hist.update_layout(
+        title='Voter Participation by Election',
+        xaxis_title='Election',
+        yaxis_title='Number of Voters',
+        bargap=0.1
+    )
+    return {
+        'birth-year-chart': birth_year_hist,
+        'party-affiliation-chart': party_affiliation_pie,
+        'election-participation-chart': election_participation_hist,
+    }
+
+
+def filter_key(form):
+    ''' Short stable key of a bound filter form: equal filters give equal keys however they were written '''
+    if not form.is_valid():
+        return 'all'
+    normalized = json.dumps(form.cleaned_data, sort_keys=True, default=str)
+    return hashlib.md5(normalized.encode()).hexdigest()
+
+
+def render_charts(form):
+    ''' Returns a JSON object of the figures by element id for a bound filter form, safe to embed in a <script> '''
+    figures = build_figures(*cube_totals(filter_cube(form)))
+    charts = '{' + ','.join(f"{json.dumps(element_id)}:{figure.to_json()}" for element_id, figure in figures.items()) + '}'
+    return charts.translate(SCRIPT_ESCAPES)
+
+
+def charts_json(form):
+    ''' render_charts(form), cached by filter and data version '''
+    key = f"voter_analytics:charts:{data_version()}:{filter_key(form)}"
+    charts = cache.get(key)
+    if charts is None:
+        charts = render_charts(form)
+        cache.set(key, charts, getattr(settings, 'VOTER_CHART_CACHE_TIMEOUT', 60 * 60))
+    return mark_safe(charts)
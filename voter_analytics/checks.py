@@ -0,0 +1,88 @@
+''' Deploy check that starting the site does not query the database.
+
+A query at import time (a form building its choices in the class body, say)
+runs in every manage.py command and every gunicorn worker boot, and fails on a
+fresh database. The check starts a separate interpreter, blocks database access
+while it loads the apps, the URLconf and the WSGI application, and reports each
+query with the project line that made it.
+
+This module must not import models: the checking interpreter imports it before
+Django is set up.
+'''
+import json
+import os
+import subprocess
+import sys
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import checks
+
+# Printed before the report so stray output from the imported modules is ignored
+REPORT_MARKER = 'IMPORT-QUERIES:'
+
+
+class ImportTimeQuery(Exception):
+    pass
+
+
+def _report_import_queries():
+    ''' Runs in the checking interpreter: loads the site with queries blocked and prints what was blocked '''
+    from importlib import import_module
+
+    import django
+    from django.db import connections
+
+    project_dir = str(settings.BASE_DIR)
+    queries = []
+
+    def block(execute, sql, params, many, context):
+        frames = [f for f in traceback.extract_stack()[:-1]
+                  if f.filename.startswith(project_dir) and 'site-packages' not in f.filename]
+        where = f"{os.path.relpath(frames[-1].filename, project_dir)}:{frames[-1].lineno}" if frames else 'unknown'
+        queries.append({'sql': sql, 'where': where})
+        raise ImportTimeQuery(sql)
+
+    with ExitStack() as stack:
+        for alias in settings.DATABASES:
+            stack.enter_context(connections[alias].execute_wrapper(block))
+        for step in (
+            django.setup,
+            lambda: import_module(settings.ROOT_URLCONF),
+            lambda: import_module(settings.WSGI_APPLICATION.rsplit('.', 1)[0]),
+        ):
+            try:
+                step()
+            except Exception:
+                # The blocked query has been recorded; keep loading what can be loaded
+                if not queries:
+                    raise
+    print(REPORT_MARKER + json.dumps(queries))
+
+
+def find_import_queries():
+    ''' Returns the queries made while loading the site, as dicts with the sql and where it was run from '''
+    code = 'from voter_analytics.checks import _report_import_queries; _report_import_queries()'
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'cs412.settings')}
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith(REPORT_MARKER):
+            return json.loads(line[len(REPORT_MARKER):])
+    raise RuntimeError(f"Could not load the site to check for import-time queries:\n{result.stderr}")
+
+
+@checks.register(deploy=True)
+def check_import_time_queries(app_configs, **kwargs):
+    ''' Reports modules that query the database while the site starts. Run with: manage.py check --deploy '''
+    return [
+        checks.Error(
+            f"Database query while importing the site: {query['sql'][:200]}",
+            hint="Compute the value on first use (a callable, a cached_property or a cached helper) instead.",
+            obj=query['where'],
+            id='voter_analytics.E001',
+        )
+        for query in find_import_queries()
+    ]
@@ -0,0 +1,147 @@
+''' Optional in-memory column store of the voters, for filtering without SQL.
+
+With VOTER_COLUMNAR_SNAPSHOT on and NumPy installed, each process loads the
+voter table once into NumPy arrays: birth date, birth year, score and precinct
+as small integers, party as category codes, and the five election flags packed
+into one bitfield. VoterFilterForm filters then become vectorized boolean masks,
+answering counts, histograms and pages of ids in well under a millisecond. The
+snapshot is reloaded when the voter data version changes. That version lives in
+the database (see cube.py), so a load run by any process, such as the
+load_voters command, refreshes every server's snapshot on its next request.
+'''
+import threading
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .cube import data_version, elections_mask
+from .filters import ELECTIONS
+from .models import ELECTION_FIELDS, Voter
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def snapshot_enabled():
+    ''' True when list filtering should use the column store '''
+    return np is not None and getattr(settings, 'VOTER_COLUMNAR_SNAPSHOT', False)
+
+
+def member_of(codes, values, size):
+    ''' Mask of the codes (small non-negative integers below size) that are one of values.
+    A lookup table indexed by the codes is much faster than np.isin for a few values. '''
+    table = np.zeros(size, dtype=bool)
+    table[values] = True
+    return table[codes]
+
+
+class VoterSnapshot:
+    ''' Column arrays of every voter, in (date_of_birth, id) descending order: the voter list's order '''
+
+    def __init__(self, version=None):
+        self.version = version
+        rows = Voter.objects.order_by('-date_of_birth', '-id').values_list(
+            'id', 'date_of_birth', 'voter_score', 'precinct_number', 'party_affiliation', *ELECTION_FIELDS,
+        )
+        ids, born, scores, precincts, parties, flags = [], [], [], [], [], []
+        for row in rows.iterator(chunk_size=10000):
+            ids.append(row[0])
+            born.append(row[1])
+            scores.append(row[2])
+            precincts.append(row[3])
+            parties.append(row[4])
+            flags.append(elections_mask(row[5:]))
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.born = np.array(born, dtype='datetime64[D]')
+        self.birth_year = self.born.astype('datetime64[Y]').astype(np.int16) + 1970
+        self.voter_score = np.array(scores, dtype=np.int8)
+        self.precinct = np.array(precincts, dtype=np.int16)
+        self.party_names, party_codes = np.unique(np.array(parties, dtype=object), return_inverse=True)
+        self.party = party_codes.astype(np.int16)
+        self.elections = np.array(flags, dtype=np.uint8)
+        # Party name -> code, for filters
+        self.party_codes = {name: code for code, name in enumerate(self.party_names)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mask(self, data):
+        ''' Boolean mask of the voters matching cleaned VoterFilterForm data, like filters.voter_lookups '''
+        mask = self.elections == elections_mask(data[form_field] for form_field in ELECTIONS.values())
+        if data['party_affiliation']:
+            codes = [self.party_codes[name] for name in data['party_affiliation'].split(',') if name in self.party_codes]
+            mask &= member_of(self.party, codes, len(self.party_names))
+        if data['min_date_of_birth']:
+            mask &= self.birth_year >= int(data['min_date_of_birth'])
+        if data['max_date_of_birth']:
+            mask &= self.birth_year <= int(data['max_date_of_birth'])
+        if data['voter_score']:
+            scores = [int(score) for score in data['voter_score'].split(',')]
+            mask &= member_of(self.voter_score, scores, max(scores + [int(self.voter_score.max(initial=0))]) + 1)
+        return mask
+
+    def count(self, mask):
+        return int(np.count_nonzero(mask))
+
+    def totals(self, mask):
+        ''' Returns (by birth year, by party, by election) counts of the masked voters, like cube.cube_totals '''
+        years, year_counts = np.unique(self.birth_year[mask], return_counts=True)
+        party_counts = np.bincount(self.party[mask], minlength=len(self.party_names))
+        elections = self.elections[mask]
+        return (
+            dict(zip(years.tolist(), year_counts.tolist())),
+            {name: int(n) for name, n in zip(self.party_names, party_counts) if n},
+            {field: int(np.count_nonzero(elections & (1 << bit))) for bit, field in enumerate(ELECTION_FIELDS)},
+        )
+
+    def page_ids(self, mask, start, stop):
+        ''' Ids of the masked voters from position start to stop, in list order '''
+        return self.ids[mask][start:stop].tolist()
+
+
+def get_snapshot():
+    ''' The process's snapshot of the current voter data, loading it on first use and after each data load '''
+    global _snapshot
+    version = data_version()
+    if _snapshot is None or _snapshot.version != version:
+        with _lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = VoterSnapshot(version)
+    return _snapshot
+
+
+class SnapshotResults:
+    ''' The voters matching a filter as a sliceable sequence for Paginator. Only the sliced page is read from the database. '''
+
+    def __init__(self, snapshot, mask):
+        self.snapshot = snapshot
+        self.mask = mask
+
+    def count(self):
+        return self.snapshot.count(self.mask)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.snapshot.page_ids(self.mask, index.start or 0, index.stop)
+        voters = Voter.objects.in_bulk(ids)
+        # A voter deleted since the snapshot was taken is skipped
+        return [voters[pk] for pk in ids if pk in voters]
+
+    def seek(self, date_of_birth, pk, after=True):
+        ''' The results after (or with after=False, before) the voter at (date_of_birth, pk) in list order '''
+        snapshot = self.snapshot
+        born = np.datetime64(date_of_birth, 'D')
+        if after:
+            beyond = (snapshot.born < born) | ((snapshot.born == born) & (snapshot.ids < pk))
+        else:
+            beyond = (snapshot.born > born) | ((snapshot.born == born) & (snapshot.ids > pk))
+        return SnapshotResults(snapshot, self.mask & beyond)
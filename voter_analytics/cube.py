@@ -0,0 +1,113 @@
+''' Precomputed voter counts for the graphs page.
+
+VoterCube holds one row per (birth year, party, score, elections bitmask) with
+the number of voters in it. Any VoterFilterForm filter selects whole cells,
+because birth dates are filtered by whole years and all five election flags
+are always compared, so the graphs are sums over a few hundred cells at most,
+however many voters there are.
+'''
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import ExtractYear, Greatest
+
+from .models import ELECTION_FIELDS, Voter, VoterCube, VoterDataVersion
+
+
+def elections_mask(flags):
+    ''' Bitmask of the election flags, given in ELECTION_FIELDS order '''
+    return sum(1 << bit for bit, voted in enumerate(flags) if voted)
+
+
+def voted_in(mask):
+    ''' The ELECTION_FIELDS set in a bitmask '''
+    return [field for bit, field in enumerate(ELECTION_FIELDS) if mask & (1 << bit)]
+
+
+def rebuild_voter_cube():
+    ''' Recomputes every cube cell from the Voter table with one grouped query. Returns the number of cells. '''
+    mask = sum(
+        (Case(When(**{field: True}, then=Value(1 << bit)), default=Value(0), output_field=IntegerField())
+         for bit, field in enumerate(ELECTION_FIELDS)),
+        Value(0),
+    )
+    cells = (
+        Voter.objects.annotate(birth_year=ExtractYear('date_of_birth'), elections=mask)
+        .values('birth_year', 'party_affiliation', 'voter_score', 'elections')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        VoterCube.objects.all().delete()
+        created = VoterCube.objects.bulk_create((VoterCube(**cell) for cell in cells), batch_size=5000)
+        invalidate_voter_caches()
+    return len(created)
+
+
+def cube_cell(voter):
+    ''' The VoterCube cell lookups of a voter '''
+    return {
+        'birth_year': voter.date_of_birth.year,
+        'party_affiliation': voter.party_affiliation,
+        'voter_score': voter.voter_score,
+        'elections': elections_mask(getattr(voter, field) for field in ELECTION_FIELDS),
+    }
+
+
+def move_voter(old_cell=None, new_cell=None):
+    ''' Keeps the cube current when one voter is saved or deleted: moves it out of old_cell and into new_cell.
+    Loads rebuild the whole cube instead. '''
+    if old_cell == new_cell:
+        return
+    with transaction.atomic():
+        if old_cell:
+            VoterCube.objects.filter(**old_cell).update(count=F('count') - 1)
+            VoterCube.objects.filter(**old_cell, count=0).delete()
+        if new_cell:
+            cell, created = VoterCube.objects.get_or_create(**new_cell, defaults={'count': 1})
+            if not created:
+                VoterCube.objects.filter(pk=cell.pk).update(count=F('count') + 1)
+        invalidate_voter_caches()
+
+
+def data_version():
+    ''' Version of the voter data, read from the database so all processes agree. Cached values are keyed by it. '''
+    version = VoterDataVersion.objects.values_list('version', flat=True).first()
+    if version is None:
+        version = VoterDataVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})[0].version
+    return version
+
+
+def invalidate_voter_caches():
+    ''' Moves to a new data version, abandoning every value cached from the old data.
+
+    The version row is updated in the current transaction, so other processes
+    see the new version together with the new data.
+    '''
+    # Moving to the clock when it is ahead means a version from a rolled back
+    # transaction, or from before the row was recreated, is not reused for other data
+    if not VoterDataVersion.objects.filter(pk=1).update(version=Greatest(F('version') + 1, Value(time.time_ns()))):
+        VoterDataVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})
+
+
+def party_affiliations():
+    ''' Sorted distinct party affiliations of the voters, cached until the next load '''
+    return cache.get_or_set(
+        f"voter_analytics:party_affiliations:{data_version()}",
+        lambda: list(VoterCube.objects.values_list('party_affiliation', flat=True).distinct().order_by('party_affiliation')),
+        getattr(settings, 'VOTER_CHOICES_CACHE_TIMEOUT', 60 * 15),
+    )
+
+
+def cube_totals(cells):
+    ''' Returns (by birth year, by party, by election) voter counts of a VoterCube queryset, each as a dict '''
+    by_year = dict(cells.values_list('birth_year').annotate(n=Sum('count')).order_by('birth_year'))
+    by_party = dict(cells.values_list('party_affiliation').annotate(n=Sum('count')).order_by('party_affiliation'))
+    by_election = dict.fromkeys(ELECTION_FIELDS, 0)
+    for mask, n in cells.values_list('elections').annotate(n=Sum('count')).order_by():
+        for field in voted_in(mask):
+            by_election[field] += n
+    return by_year, by_party, by_election
@@ -0,0 +1,102 @@
+''' Streaming exports of filtered voters.
+
+Rows are read with a server-side iterator and written out chunk by chunk, so
+an export of the whole voter file uses as little memory as one of ten rows.
+CSV is always available; Parquet, a compressed columnar format for analysts,
+when pyarrow is installed.
+'''
+import csv
+from itertools import islice
+
+from django.conf import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from .models import ELECTION_FIELDS
+
+# Exported columns, in order
+EXPORT_FIELDS = (
+    'id', 'last_name', 'first_name', 'street_number', 'street_name', 'apartment_number', 'zip_code',
+    'date_of_birth', 'date_of_registration', 'party_affiliation', 'precinct_number', *ELECTION_FIELDS, 'voter_score',
+)
+
+
+def export_chunk_size():
+    return getattr(settings, 'VOTER_EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_formats():
+    ''' The formats this install can export '''
+    return ['csv', 'parquet'] if pq is not None else ['csv']
+
+
+class Echo:
+    ''' File-like object that returns what is written to it, for csv.writer '''
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(queryset):
+    ''' Yields the export as CSV text, one line at a time '''
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=export_chunk_size()):
+        yield writer.writerow(row)
+
+
+class ChunkSink:
+    ''' Write-only stream that keeps what was written until it is taken, for streaming a ParquetWriter '''
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    strings = ('last_name', 'first_name', 'street_number', 'street_name', 'apartment_number', 'zip_code', 'party_affiliation')
+    types = {
+        'id': pa.int64(), 'date_of_birth': pa.date32(), 'date_of_registration': pa.date32(),
+        'precinct_number': pa.int16(), 'voter_score': pa.int8(),
+        **dict.fromkeys(strings, pa.string()), **dict.fromkeys(ELECTION_FIELDS, pa.bool_()),
+    }
+    return pa.schema([(field, types[field]) for field in EXPORT_FIELDS])
+
+
+def parquet_chunks(queryset):
+    ''' Yields the export as a Parquet file, one row group per chunk of voters '''
+    schema = parquet_schema()
+    sink = ChunkSink()
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=export_chunk_size())
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd') as writer:
+        while batch := list(islice(rows, export_chunk_size())):
+            columns = zip(*batch)
+            writer.write_table(pa.table([pa.array(column, type) for column, type in zip(columns, schema.types)], schema=schema))
+            yield sink.take()
+    # Closing the writer writes the footer
+    yield sink.take()
@@ -0,0 +1,79 @@
+''' Voter filtering shared by the list and graph views.
+
+Every filtered query has equality conditions on all five election flags (an
+unchecked box means "did not vote"), optionally combined with a party, a birth
+year range and a voter score. The Voter indexes are chosen for these shapes.
+'''
+from datetime import date
+
+from django.db.models import Sum
+
+from .cube import elections_mask
+from .forms import VoterFilterForm
+from .models import VoterCube
+
+# Voter field -> VoterFilterForm field of each election flag
+ELECTIONS = {
+    'v20state': 'voted_in_v20state',
+    'v21town': 'voted_in_v21town',
+    'v21primary': 'voted_in_v21primary',
+    'v22general': 'voted_in_v22general',
+    'v23town': 'voted_in_v23town',
+}
+
+
+def voter_lookups(data):
+    ''' Returns the filter() lookups for cleaned VoterFilterForm data '''
+    lookups = {}
+    if data['party_affiliation']:
+        lookups['party_affiliation__in'] = data['party_affiliation'].split(',')
+    if data['min_date_of_birth']:
+        lookups['date_of_birth__gte'] = date(int(data['min_date_of_birth']), 1, 1)
+    if data['max_date_of_birth']:
+        lookups['date_of_birth__lte'] = date(int(data['max_date_of_birth']), 12, 31)
+    if data['voter_score']:
+        lookups['voter_score__in'] = [int(score) for score in data['voter_score'].split(',')]
+    # Written as single-value IN: SQLite compiles a plain boolean filter to a bare
+    # "flag" / NOT "flag" test, which cannot use an index
+    for field, form_field in ELECTIONS.items():
+        lookups[f"{field}__in"] = [data[form_field]]
+    return lookups
+
+
+def filter_voters(queryset, params):
+    ''' Returns (queryset, form): the voters matching the filter query parameters, and the bound filter form.
+
+    An invalid form leaves the queryset unfiltered.
+    '''
+    form = VoterFilterForm(params)
+    if form.is_valid():
+        queryset = queryset.filter(**voter_lookups(form.cleaned_data))
+    return queryset, form
+
+
+def cube_lookups(data):
+    ''' Returns the VoterCube filter() lookups selecting the cells of the voters that voter_lookups matches '''
+    lookups = {}
+    if data['party_affiliation']:
+        lookups['party_affiliation__in'] = data['party_affiliation'].split(',')
+    if data['min_date_of_birth']:
+        lookups['birth_year__gte'] = int(data['min_date_of_birth'])
+    if data['max_date_of_birth']:
+        lookups['birth_year__lte'] = int(data['max_date_of_birth'])
+    if data['voter_score']:
+        lookups['voter_score__in'] = [int(score) for score in data['voter_score'].split(',')]
+    lookups['elections'] = elections_mask(data[form_field] for form_field in ELECTIONS.values())
+    return lookups
+
+
+def filter_cube(form):
+    ''' Returns the VoterCube cells matching a bound filter form; all cells when it is invalid '''
+    cells = VoterCube.objects.all()
+    if form.is_valid():
+        cells = cells.filter(**cube_lookups(form.cleaned_data))
+    return cells
+
+
+def cube_count(form):
+    ''' Number of voters matching a bound filter form (all voters when it is invalid), from the cube '''
+    return filter_cube(form).aggregate(n=Sum('count'))['n'] or 0
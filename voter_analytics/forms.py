@@ -1,11 +1,17 @@
 from datetime import datetime
 from django import forms
-from .models import Voter
+from .cube import party_affiliations
+
+
+def party_choices():
+    # Looked up when a form is used, not when this module is imported
+    return [('', 'All')] + [(party, party) for party in party_affiliations()]
+
 
 class VoterFilterForm(forms.Form):
     # Form for filtering voters by party affiliation, date of birth range, voter score, and/or election participation.
     party_affiliation = forms.ChoiceField(
-        choices=[('', 'All')] + list(Voter.objects.values_list('party_affiliation', 'party_affiliation').distinct()),
+        choices=party_choices,
         required=False,
     )
     min_date_of_birth = forms.ChoiceField(
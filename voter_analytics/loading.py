@@ -0,0 +1,219 @@
+''' Streaming bulk loader for the Newton voter file.
+
+Rows are parsed lazily from the CSV and inserted with bulk_create in batches, all
+inside one transaction, so a load either completes or leaves the table as it
+was. Rows that cannot be converted are written to a rejects CSV with the line
+number and the reason, instead of stopping the load.
+
+For large files, load_voters_parallel splits the CSV into byte ranges on line
+boundaries and parses them in worker processes, which hand back value tuples
+to the single writer in this process.
+'''
+import csv
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+
+import django
+from django.db import transaction
+
+from .cube import rebuild_voter_cube
+from .models import Voter
+
+# CSV column -> Voter field for the plain text columns
+TEXT_COLUMNS = {
+    'Last Name': 'last_name',
+    'First Name': 'first_name',
+    'Residential Address - Street Number': 'street_number',
+    'Residential Address - Street Name': 'street_name',
+    'Residential Address - Zip Code': 'zip_code',
+    'Party Affiliation': 'party_affiliation',
+}
+APARTMENT_COLUMN = 'Residential Address - Apartment Number'
+ELECTION_COLUMNS = ('v20state', 'v21town', 'v21primary', 'v22general', 'v23town')
+
+# Anything other than TRUE counts as not having voted, as in the original loader
+BOOLEANS = {'TRUE': True}
+
+# Longest value each text field accepts, so bad rows are rejected here instead of failing a whole batch
+MAX_LENGTHS = {f.name: f.max_length for f in Voter._meta.get_fields() if getattr(f, 'max_length', None)}
+
+
+def text(row, column):
+    ''' Stripped value of a column; missing columns are empty '''
+    return (row.get(column) or '').strip()
+
+
+# Order of the values in the row tuples handed from the parser to the writer
+FIELDS = (
+    *TEXT_COLUMNS.values(), 'apartment_number', *ELECTION_COLUMNS,
+    'date_of_birth', 'date_of_registration', 'precinct_number', 'voter_score',
+)
+
+
+def parse_values(row):
+    ''' Returns the values of one CSV row, in FIELDS order. Raises ValueError when the row is invalid. '''
+    values = [text(row, column) for column in TEXT_COLUMNS]
+    values.append(text(row, APARTMENT_COLUMN) or None)
+    for field, value in zip(FIELDS, values):
+        if value and len(value) > MAX_LENGTHS[field]:
+            raise ValueError(f"{field} is longer than {MAX_LENGTHS[field]} characters")
+
+    values.extend(BOOLEANS.get(text(row, column).upper(), False) for column in ELECTION_COLUMNS)
+    values.append(date.fromisoformat(text(row, 'Date of Birth')))
+    values.append(date.fromisoformat(text(row, 'Date of Registration')))
+    values.append(int(text(row, 'Precinct Number')))
+    values.append(int(text(row, 'voter_score') or 0))
+    return tuple(values)
+
+
+def parse_row(row):
+    ''' Returns an unsaved Voter for one CSV row. Raises ValueError when the row is invalid. '''
+    return Voter(**dict(zip(FIELDS, parse_values(row))))
+
+
+def parse_voters(lines, rejects):
+    ''' Yields a Voter for each valid row of the CSV lines. Invalid rows are passed to rejects(line_number, row, error). '''
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            yield parse_row(row)
+        except ValueError as e:
+            rejects(reader.line_num, row, e)
+
+
+class RejectsFile:
+    ''' CSV of the rows that could not be loaded: the original columns plus line and error. Created on first use. '''
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def __call__(self, line_number, row, error):
+        if self._writer is None:
+            self._file = open(self.path, 'w', newline='')
+            self._writer = csv.DictWriter(
+                self._file, fieldnames=['line', 'error', *filter(None, row)], extrasaction='ignore'
+            )
+            self._writer.writeheader()
+        self._writer.writerow({'line': line_number, 'error': str(error) or type(error).__name__, **row})
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def load_voters(path, batch_size=5000, rejects_path=None, replace=False, progress=None):
+    ''' Loads the voter CSV at path and returns (loaded, rejected, seconds).
+
+    With replace, existing voters are deleted first, in the same transaction.
+    The graphs' VoterCube is rebuilt at the end.
+    Rejected rows go to rejects_path (default: <path>.rejects.csv). progress, if
+    given, is called with the number of rows loaded after each batch.
+    '''
+    started = time.perf_counter()
+    rejects = RejectsFile(rejects_path or os.path.splitext(path)[0] + '.rejects.csv')
+    loaded = 0
+    try:
+        with open(path, newline='', encoding='utf-8') as f, transaction.atomic():
+            if replace:
+                Voter.objects.all().delete()
+            voters = parse_voters(f, rejects)
+            while batch := list(islice(voters, batch_size)):
+                Voter.objects.bulk_create(batch)
+                loaded += len(batch)
+                if progress:
+                    progress(loaded)
+            rebuild_voter_cube()
+    finally:
+        rejects.close()
+    return loaded, rejects.count, time.perf_counter() - started
+
+
+def partition_offsets(path, parts):
+    ''' Splits the data lines of the CSV at path into up to parts (start, end) byte ranges ending on line breaks.
+
+    Boundaries are found by seeking, so quoted values must not contain line
+    breaks; the voter files have none.
+    '''
+    size = os.path.getsize(path)
+    offsets = []
+    with open(path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        for n in range(1, parts + 1):
+            if n == parts:
+                end = size
+            else:
+                # Move the boundary to the start of the next line
+                f.seek(max(start, size * n // parts))
+                f.readline()
+                end = f.tell()
+            if end > start:
+                offsets.append((start, end))
+                start = end
+    return offsets
+
+
+def parse_partition(path, start, end, header):
+    ''' Parses one byte range of the CSV in a worker process.
+
+    Returns (rows, rejects, lines): the value tuples of the valid rows,
+    (line, row, error) for the invalid ones with line numbers counted from the
+    start of the range, and the number of lines in the range.
+    '''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+    reader = csv.DictReader(io.StringIO(data, newline=''), fieldnames=header)
+    rows, rejects = [], []
+    for row in reader:
+        try:
+            rows.append(parse_values(row))
+        except ValueError as e:
+            rejects.append((reader.line_num, row, str(e) or type(e).__name__))
+    return rows, rejects, reader.line_num
+
+
+def load_voters_parallel(path, workers=None, batch_size=5000, rejects_path=None, replace=False, progress=None):
+    ''' Same as load_voters, with the parsing spread over worker processes (default: one per CPU) '''
+    started = time.perf_counter()
+    workers = workers or os.cpu_count()
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    # Several partitions per worker keep them all busy when partitions parse at different speeds
+    partitions = deque(partition_offsets(path, workers * 4))
+
+    rejects = RejectsFile(rejects_path or os.path.splitext(path)[0] + '.rejects.csv')
+    loaded = 0
+    line_offset = 1  # the header
+    try:
+        with ProcessPoolExecutor(workers, initializer=django.setup) as pool, transaction.atomic():
+            if replace:
+                Voter.objects.all().delete()
+            # Bound the parsed partitions waiting for the writer, to bound memory
+            pending = deque()
+            while partitions or pending:
+                while partitions and len(pending) < workers * 2:
+                    pending.append(pool.submit(parse_partition, path, *partitions.popleft(), header))
+                rows, rejected, lines = pending.popleft().result()
+
+                for line, row, error in rejected:
+                    rejects(line_offset + line, row, error)
+                line_offset += lines
+                for start in range(0, len(rows), batch_size):
+                    Voter.objects.bulk_create([Voter(**dict(zip(FIELDS, values))) for values in rows[start:start + batch_size]])
+                loaded += len(rows)
+                if progress:
+                    progress(loaded)
+            rebuild_voter_cube()
+    finally:
+        rejects.close()
+    return loaded, rejects.count, time.perf_counter() - started
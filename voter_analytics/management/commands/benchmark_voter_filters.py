@@ -0,0 +1,86 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from voter_analytics.columnar import VoterSnapshot, np
+from voter_analytics.filters import filter_voters, voter_lookups
+from voter_analytics.loading import load_voters
+from voter_analytics.models import Voter
+
+from .benchmark_voter_load import write_sample_csv
+
+# Filter query parameters timed, by name
+FILTERS = {
+    'no votes': {},
+    'voted 2020 state': {'voted_in_v20state': 'on'},
+    'party': {'party_affiliation': 'D', 'voted_in_v22general': 'on'},
+    'birth years': {'min_date_of_birth': '1950', 'max_date_of_birth': '1980', 'voted_in_v20state': 'on'},
+    'everything': {
+        'party_affiliation': 'R', 'min_date_of_birth': '1940', 'max_date_of_birth': '1990', 'voter_score': '3',
+        'voted_in_v20state': 'on', 'voted_in_v22general': 'on', 'voted_in_v23town': 'on',
+    },
+}
+
+
+def best_of(repeat, function):
+    ''' Fastest of repeat calls of function, in milliseconds, and its last result '''
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares filtering the voter list with the ORM and with the NumPy column store: "
+        "the match count and the first page of ids for several filters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=0,
+                            help="Time against this many generated voters (rolled back) instead of the voter table")
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def orm(self, data, page_size):
+        queryset = Voter.objects.filter(**voter_lookups(data)).order_by('-date_of_birth', '-id')
+        return queryset.count(), list(queryset.values_list('id', flat=True)[:page_size])
+
+    def columnar(self, snapshot, data, page_size):
+        mask = snapshot.mask(data)
+        return snapshot.count(mask), snapshot.page_ids(mask, 0, page_size)
+
+    def run(self, page_size, repeat):
+        seconds, snapshot = best_of(1, VoterSnapshot)
+        self.stdout.write(f"Snapshot of {len(snapshot)} voters loaded in {seconds:.0f}ms")
+        for name, params in FILTERS.items():
+            # Both paths validate the same form; only the filtering itself is timed
+            _, form = filter_voters(Voter.objects.none(), params)
+            if not form.is_valid():
+                raise CommandError(f"Invalid filter {params}: {form.errors.as_text()}")
+            orm_ms, expected = best_of(repeat, lambda: self.orm(form.cleaned_data, page_size))
+            columnar_ms, result = best_of(repeat, lambda: self.columnar(snapshot, form.cleaned_data, page_size))
+            if result != expected:
+                raise CommandError(f"{name}: the column store returned {result[0]} voters, the ORM {expected[0]}")
+            self.stdout.write(
+                f"{name:>16}: {expected[0]:>8} voters, ORM {orm_ms:8.2f}ms, "
+                f"column store {columnar_ms:7.2f}ms ({orm_ms / max(columnar_ms, 1e-6):.1f}x)"
+            )
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("The column store needs numpy installed")
+        if not options['rows']:
+            return self.run(options['page_size'], options['repeat'])
+        with tempfile.TemporaryDirectory() as directory, transaction.atomic():
+            path = os.path.join(directory, 'voters.csv')
+            write_sample_csv(path, options['rows'])
+            load_voters(path, rejects_path=os.path.join(directory, 'rejects.csv'), replace=True)
+            self.run(options['page_size'], options['repeat'])
+            transaction.set_rollback(True)
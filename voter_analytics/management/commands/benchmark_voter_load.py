@@ -0,0 +1,75 @@
+import csv
+import os
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from voter_analytics.loading import load_voters, load_voters_parallel
+
+HEADER = [
+    'Voter ID Number', 'Last Name', 'First Name', 'Residential Address - Street Number',
+    'Residential Address - Street Name', 'Residential Address - Apartment Number',
+    'Residential Address - Zip Code', 'Date of Birth', 'Date of Registration', 'Party Affiliation',
+    'Precinct Number', 'v20state', 'v21town', 'v21primary', 'v22general', 'v23town', 'voter_score',
+]
+
+
+def write_sample_csv(path, rows, seed=0):
+    ''' Writes a synthetic voter file of the given number of rows '''
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for n in range(rows):
+            votes = [rng.choice(('TRUE', 'FALSE')) for _ in range(5)]
+            writer.writerow([
+                f"N{n}", f"Last{n % 5000}", f"First{n % 700}", str(rng.randint(1, 999)), 'Commonwealth Ave',
+                rng.choice(('', '', '', str(rng.randint(1, 40)))), '02458',
+                f"{rng.randint(1920, 2005)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}",
+                f"{rng.randint(1990, 2023)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}",
+                rng.choice(('D ', 'R ', 'U ', 'L ', 'J ')), str(rng.randint(1, 8)), *votes, votes.count('TRUE'),
+            ])
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the rows/second of the single-process and the parallel voter loaders. "
+        "Both loads are rolled back, so the voter table is left unchanged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Voter CSV to load (default: a generated file of --rows rows)")
+        parser.add_argument('--rows', type=int, default=100000, help="Rows of the generated file")
+        parser.add_argument('--workers', type=int, default=0, help="Parallel loader processes (0 = one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def load(self, loader, path, **kwargs):
+        ''' Runs one load and rolls it back. Returns (rows, seconds). '''
+        with tempfile.TemporaryDirectory() as directory, transaction.atomic():
+            loaded, rejected, seconds = loader(path, rejects_path=os.path.join(directory, 'rejects.csv'), **kwargs)
+            transaction.set_rollback(True)
+        return loaded + rejected, seconds
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = options['path']
+            if path is None:
+                path = os.path.join(directory, 'voters.csv')
+                write_sample_csv(path, options['rows'])
+            elif not os.path.exists(path):
+                raise CommandError(f"{path} does not exist")
+
+            results = {
+                'single process': self.load(load_voters, path, batch_size=options['batch_size']),
+                f"{options['workers'] or os.cpu_count()} workers": self.load(
+                    load_voters_parallel, path, workers=options['workers'] or None, batch_size=options['batch_size'],
+                ),
+            }
+
+        baseline = None
+        for name, (rows, seconds) in results.items():
+            rate = rows / seconds if seconds else 0
+            baseline = baseline or rate
+            self.stdout.write(f"{name:>16}: {rows} rows in {seconds:.2f}s, {rate:,.0f} rows/s ({rate / baseline:.2f}x)")
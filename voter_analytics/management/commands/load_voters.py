@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voter_analytics.loading import load_voters, load_voters_parallel
+
+
+class Command(BaseCommand):
+    help = "Bulk-loads a voter CSV (by default the Newton voter file) into voter_analytics."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(os.path.dirname(__file__), '..', '..', 'newton_voters.csv'),
+            help="Voter CSV to load (default: voter_analytics/newton_voters.csv)",
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT")
+        parser.add_argument('--rejects', help="Where to write rows that could not be loaded (default: <path>.rejects.csv)")
+        parser.add_argument('--replace', action='store_true', help="Delete the existing voters first")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes parsing the file in parallel (1 = parse in this process, 0 = one per CPU)")
+
+    def handle(self, *args, **options):
+        path = os.path.normpath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        rejects_path = options['rejects'] or os.path.splitext(path)[0] + '.rejects.csv'
+
+        def progress(loaded):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Loaded {loaded} rows")
+
+        kwargs = dict(
+            batch_size=options['batch_size'], rejects_path=rejects_path, replace=options['replace'], progress=progress,
+        )
+        if options['workers'] == 1:
+            loaded, rejected, seconds = load_voters(path, **kwargs)
+        else:
+            loaded, rejected, seconds = load_voters_parallel(path, workers=options['workers'] or None, **kwargs)
+        rate = (loaded + rejected) / seconds if seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {loaded} voters in {seconds:.1f}s ({rate:,.0f} rows/s), rejected {rejected}"
+        ))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"Rejected rows were written to {rejects_path}"))
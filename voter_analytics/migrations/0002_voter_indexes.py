@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(fields=['v20state', 'v21town', 'v21primary', 'v22general', 'v23town', 'date_of_birth'], name='voter_elections_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(fields=['party_affiliation', 'v20state', 'v21town', 'v21primary', 'v22general', 'v23town', 'date_of_birth'], name='voter_party_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(fields=['voter_score', 'v20state', 'v21town', 'v21primary', 'v22general', 'v23town', 'date_of_birth'], name='voter_score_elections_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(fields=['date_of_birth'], name='voter_dob_idx'),
+        ),
+    ]
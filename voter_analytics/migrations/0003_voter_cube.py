@@ -0,0 +1,49 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:47
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import ExtractYear
+
+ELECTION_FIELDS = ['v20state', 'v21town', 'v21primary', 'v22general', 'v23town']
+
+
+def build_cube(apps, schema_editor):
+    Voter = apps.get_model('voter_analytics', 'Voter')
+    VoterCube = apps.get_model('voter_analytics', 'VoterCube')
+    mask = sum(
+        (Case(When(**{field: True}, then=Value(1 << bit)), default=Value(0), output_field=IntegerField())
+         for bit, field in enumerate(ELECTION_FIELDS)),
+        Value(0),
+    )
+    cells = (
+        Voter.objects.annotate(birth_year=ExtractYear('date_of_birth'), elections=mask)
+        .values('birth_year', 'party_affiliation', 'voter_score', 'elections')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    VoterCube.objects.bulk_create([VoterCube(**cell) for cell in cells], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0002_voter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('birth_year', models.PositiveSmallIntegerField()),
+                ('party_affiliation', models.CharField(max_length=50)),
+                ('voter_score', models.IntegerField()),
+                ('elections', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('elections', 'birth_year', 'party_affiliation', 'voter_score'), name='unique_voter_cube_cell')],
+            },
+        ),
+        migrations.RunPython(build_cube, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:11
+
+import time
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    # Starting from the clock, the first version never repeats one cached before
+    VoterDataVersion = apps.get_model('voter_analytics', 'VoterDataVersion')
+    VoterDataVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0003_voter_cube'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterDataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
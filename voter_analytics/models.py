@@ -1,8 +1,10 @@
 from django.db import models
-from datetime import datetime
-import csv
 import os
 
+# The election participation flags, oldest first
+ELECTION_FIELDS = ['v20state', 'v21town', 'v21primary', 'v22general', 'v23town']
+
+
 class Voter(models.Model):
     #  Identity information
     last_name = models.CharField(max_length=100)
@@ -30,6 +32,20 @@ class Voter(models.Model):
     # Voting score
     voter_score = models.IntegerField()
 
+    class Meta:
+        # Chosen for the filter shapes in filters.py: every filtered query has
+        # equalities on all five election flags, and the list is ordered by birth date
+        indexes = [
+            # Election flags alone, with a birth date range and the list order
+            models.Index(fields=[*ELECTION_FIELDS, 'date_of_birth'], name='voter_elections_dob_idx'),
+            # Party filter, then the flags, with a birth date range and the list order
+            models.Index(fields=['party_affiliation', *ELECTION_FIELDS, 'date_of_birth'], name='voter_party_dob_idx'),
+            # Voter score filter, then the flags and the list order
+            models.Index(fields=['voter_score', *ELECTION_FIELDS, 'date_of_birth'], name='voter_score_elections_idx'),
+            # Unfiltered list order
+            models.Index(fields=['date_of_birth'], name='voter_dob_idx'),
+        ]
+
     def __str__(self):
         return (
             f"Voter ID: {self.id}, "
@@ -45,54 +61,43 @@ class Voter(models.Model):
             f"Score: {self.voter_score}"
         )
 
+class VoterCube(models.Model):
+    # Number of voters in each (birth year, party, score, elections voted in)
+    # cell, so the graphs can sum cells instead of scanning voters. Rebuilt
+    # from Voter after each load; see cube.py.
+    birth_year = models.PositiveSmallIntegerField()
+    party_affiliation = models.CharField(max_length=50)
+    voter_score = models.IntegerField()
+    # Bit i is set when the voters voted in ELECTION_FIELDS[i]
+    elections = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['elections', 'birth_year', 'party_affiliation', 'voter_score'], name='unique_voter_cube_cell'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.birth_year}/{self.party_affiliation}/{self.voter_score}/{self.elections:05b}: {self.count}"
+
+
+class VoterDataVersion(models.Model):
+    # A single row, bumped in the same transaction as every change to the voter
+    # data. Cached values and per-process snapshots derived from the voters are
+    # keyed by it, so every process sees a load as soon as it commits.
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Voter data version {self.version}"
+
+
 def load_data():
+    ''' Loads newton_voters.csv from this directory. See the load_voters management command for options. '''
+    from .loading import load_voters
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_file = os.path.join(current_dir, "newton_voters.csv") 
-
-    records_processed = 0
-    records_skipped = 0
+    data_file = os.path.join(current_dir, "newton_voters.csv")
 
-    with open(data_file, 'r') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            try:
-                # Create a new Voter instance from the row data
-                voter = Voter(
-                    last_name=row.get('Last Name', '').strip(),
-                    first_name=row.get('First Name', '').strip(),
-                    street_number=row.get('Residential Address - Street Number', '').strip() or '',
-                    street_name=row.get('Residential Address - Street Name', '').strip() or '',
-                    apartment_number=row.get('Residential Address - Apartment Number', '').strip() if row.get('Residential Address - Apartment Number') else None,
-                    zip_code=row.get('Residential Address - Zip Code', '').strip(),
-                    date_of_birth=datetime.strptime(row['Date of Birth'], '%Y-%m-%d').date(),
-                    date_of_registration=datetime.strptime(row['Date of Registration'], '%Y-%m-%d').date(),
-                    party_affiliation=row.get('Party Affiliation', '').strip(),
-                    precinct_number=int(row['Precinct Number']),
-                    v20state=str(row.get('v20state', 'FALSE')).upper() == 'TRUE',
-                    v21town=str(row.get('v21town', 'FALSE')).upper() == 'TRUE',
-                    v21primary=str(row.get('v21primary', 'FALSE')).upper() == 'TRUE',
-                    v22general=str(row.get('v22general', 'FALSE')).upper() == 'TRUE',
-                    v23town=str(row.get('v23town', 'FALSE')).upper() == 'TRUE',
-                    voter_score=int(row.get('voter_score', 0))
-                )
-                
-                # Save the voter record to the database
-                voter.save()
-                records_processed += 1
-                
-                # Update every 1k records processed
-                if records_processed % 1000 == 0:
-                    print(f"Processed {records_processed} records...")
-                    
-            except Exception as e:
-                records_skipped += 1
-                print(f"\nError on record {records_skipped}:")
-                print(f"Last Name: {row.get('Last Name', 'N/A')}")
-                print(f"Error: {str(e)}")
-                continue
-                
-    print(f"\nLoad completed:")
-    print(f"Successfully processed: {records_processed} records")
-    print(f"Skipped records: {records_skipped}")
-    
-    
+    loaded, rejected, seconds = load_voters(data_file)
+    print(f"Loaded {loaded} voters in {seconds:.1f}s, rejected {rejected}")
@@ -0,0 +1,129 @@
+''' Pagination of the voter list.
+
+Counts come from the VoterCube, whose cells the filters select whole, so the
+total costs the same however many voters match. Pages are found by keyset
+cursors on the list order (date_of_birth, id) descending: each next or
+previous page is one index range scan, however deep it is.
+'''
+import base64
+from datetime import date
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .columnar import SnapshotResults
+from .filters import cube_count
+
+
+def encode_cursor(voter):
+    ''' Returns an opaque cursor pointing at the given voter '''
+    raw = f"{voter.date_of_birth.isoformat()}|{voter.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    ''' Returns the (date_of_birth, id) pair of a cursor. Raises ValueError on malformed input. '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_of_birth, pk = raw.split('|')
+        return date.fromisoformat(date_of_birth), int(pk)
+    except (TypeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+class KeysetPage:
+    ''' One page of voters with the cursors of its neighbours. Enough of Page for ListView and the template. '''
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class VoterPaginator(Paginator):
+    ''' Keyset paginator of a voter list ordered by (date_of_birth, id) descending.
+
+    object_list is a filtered Voter queryset or SnapshotResults, and form the
+    bound filter form it was filtered with. The count is read from the cube;
+    without a form, or when the cube is empty (not built yet), at most
+    count_cap + 1 voters are counted.
+    '''
+    count_cap = 10000
+
+    def __init__(self, object_list, per_page, form=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.form = form
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, SnapshotResults):
+            return self.object_list.count()
+        if self.form is not None:
+            count = cube_count(self.form)
+            if count:
+                return count
+        return self.object_list[:self.count_cap + 1].count()
+
+    @property
+    def is_capped(self):
+        ''' True when there are more voters than were counted '''
+        return self.count > self.count_cap
+
+    def seek(self, cursor, after=True):
+        ''' The voters after (or with after=False, before) cursor's voter in list order '''
+        date_of_birth, pk = decode_cursor(cursor)
+        if isinstance(self.object_list, SnapshotResults):
+            return self.object_list.seek(date_of_birth, pk, after)
+        # The plain bound on date_of_birth lets the index range scan start at the cursor; the OR alone cannot
+        if after:
+            return self.object_list.filter(
+                Q(date_of_birth__lt=date_of_birth) | Q(date_of_birth=date_of_birth, id__lt=pk), date_of_birth__lte=date_of_birth,
+            )
+        return self.object_list.filter(
+            Q(date_of_birth__gt=date_of_birth) | Q(date_of_birth=date_of_birth, id__gt=pk), date_of_birth__gte=date_of_birth,
+        )
+
+    def keyset_page(self, after=None, before=None):
+        ''' The page following the after cursor, the page preceding the before cursor, or the first page.
+        Raises ValueError on a malformed cursor. '''
+        size = self.per_page
+        if before:
+            voters = self.seek(before, after=False)
+            # Fetch one extra row, nearest the cursor first, to know whether there is a previous page
+            if isinstance(voters, SnapshotResults):
+                matched = voters.count()
+                voters = voters[max(matched - size - 1, 0):matched][::-1]
+            else:
+                voters = list(voters.reverse()[:size + 1])
+            has_previous = len(voters) > size
+            voters = voters[:size][::-1]
+            has_next = True
+        else:
+            voters = self.seek(after) if after else self.object_list
+            voters = list(voters[:size + 1])
+            has_next = len(voters) > size
+            voters = voters[:size]
+            has_previous = bool(after)
+
+        return KeysetPage(
+            voters, self,
+            next_cursor=encode_cursor(voters[-1]) if voters and has_next else None,
+            previous_cursor=encode_cursor(voters[0]) if voters and has_previous else None,
+        )
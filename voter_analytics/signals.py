@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cube import cube_cell, move_voter
+from .models import Voter
+
+
+# VoterCube counts follow individual voter edits (the admin, the shell); bulk loads rebuild it
+
+@receiver(pre_save, sender=Voter)
+def remember_cube_cell(sender, instance, **kwargs):
+    ''' Notes the cell the voter is counted in before the save changes it '''
+    old = Voter.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._old_cube_cell = cube_cell(old) if old else None
+
+
+@receiver(post_save, sender=Voter)
+def count_voter_on_save(sender, instance, **kwargs):
+    move_voter(getattr(instance, '_old_cube_cell', None), cube_cell(instance))
+
+
+@receiver(post_delete, sender=Voter)
+def count_voter_on_delete(sender, instance, **kwargs):
+    move_voter(old_cell=cube_cell(instance))
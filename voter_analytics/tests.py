@@ -1,3 +1,394 @@
-from django.test import TestCase
+import csv
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+from datetime import date
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.forms.models import model_to_dict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .checks import find_import_queries
+from .columnar import SnapshotResults, get_snapshot, np
+from .cube import cube_totals, rebuild_voter_cube
+from .exports import EXPORT_FIELDS, pq
+from .filters import filter_cube, filter_voters
+from .forms import VoterFilterForm
+from .loading import load_voters, load_voters_parallel, partition_offsets
+from .models import Voter, VoterCube, VoterDataVersion
+from .pagination import VoterPaginator
+
+HEADER = [
+    'Voter ID Number', 'Last Name', 'First Name', 'Residential Address - Street Number',
+    'Residential Address - Street Name', 'Residential Address - Apartment Number',
+    'Residential Address - Zip Code', 'Date of Birth', 'Date of Registration', 'Party Affiliation',
+    'Precinct Number', 'v20state', 'v21town', 'v21primary', 'v22general', 'v23town', 'voter_score',
+]
+
+
+def voter_row(n, **overrides):
+    ''' One CSV row of a voter with plausible values '''
+    row = dict(zip(HEADER, [
+        f"ID{n}", f"Last{n}", f"First{n}", str(n), 'Main St', '', '02458', '1980-05-01', '2000-01-15',
+        'D ', '1', 'TRUE', 'FALSE', 'true', 'FALSE', 'TRUE', '3',
+    ]))
+    row.update(overrides)
+    return row
+
+
+class LoadVotersTests(TestCase):
+    ''' load_voters bulk-loads the voter CSV and sets bad rows aside '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, 'voters.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=HEADER)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def test_rows_are_converted_and_bad_rows_rejected(self):
+        path = self.write_csv([
+            voter_row(1),
+            voter_row(2, **{'Date of Birth': '05/01/1980'}),
+            voter_row(3, **{'Residential Address - Apartment Number': ' 2B '}),
+        ])
+        out = StringIO()
+        call_command('load_voters', path, '--batch-size', '1', stdout=out)
+
+        self.assertIn("Loaded 2 voters", out.getvalue())
+        first, third = Voter.objects.order_by('first_name')
+        self.assertEqual((first.party_affiliation, first.date_of_birth, first.apartment_number), ('D', date(1980, 5, 1), None))
+        self.assertEqual((first.v20state, first.v21town, first.v21primary, first.voter_score), (True, False, True, 3))
+        self.assertEqual(third.apartment_number, '2B')
+
+        with open(os.path.join(self.directory, 'voters.rejects.csv'), newline='') as f:
+            rejects = list(csv.DictReader(f))
+        self.assertEqual([(r['line'], r['First Name']) for r in rejects], [('3', 'First2')])
+
+    def test_replace_reloads_the_table(self):
+        path = self.write_csv([voter_row(1), voter_row(2)])
+        call_command('load_voters', path, stdout=StringIO())
+        call_command('load_voters', path, '--replace', stdout=StringIO())
+        self.assertEqual(Voter.objects.count(), 2)
+
+    def test_parallel_load_matches_single_process_load(self):
+        rows = [voter_row(n) for n in range(200)]
+        rows[57]['Precinct Number'] = 'x'
+        path = self.write_csv(rows)
+
+        offsets = partition_offsets(path, 7)
+        self.assertEqual(len(offsets), 7)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertTrue(all(data[end - 1:end] == b'\n' for _, end in offsets))
+
+        load_voters(path, rejects_path=os.path.join(self.directory, 'serial.csv'))
+        serial = list(Voter.objects.order_by('first_name').values_list(
+            'first_name', 'date_of_birth', 'v21primary', 'voter_score'))
+        Voter.objects.all().delete()
+        loaded, rejected, _ = load_voters_parallel(path, workers=2, batch_size=30,
+                                                   rejects_path=os.path.join(self.directory, 'parallel.csv'))
+
+        self.assertEqual((loaded, rejected), (199, 1))
+        self.assertEqual(list(Voter.objects.order_by('first_name').values_list(
+            'first_name', 'date_of_birth', 'v21primary', 'voter_score')), serial)
+        for name in ('serial.csv', 'parallel.csv'):
+            with open(os.path.join(self.directory, name), newline='') as f:
+                self.assertEqual([r['line'] for r in csv.DictReader(f)], ['59'])
+
+
+def make_voter(first_name, party='D', born=date(1980, 5, 1), score=2, voted=(True, False, False, False, True)):
+    ''' Creates a Voter with placeholder details '''
+    return Voter.objects.create(
+        last_name='Test', first_name=first_name, street_number='1', street_name='Main St', zip_code='02458',
+        date_of_birth=born, date_of_registration=date(2000, 1, 1), party_affiliation=party, precinct_number=1,
+        v20state=voted[0], v21town=voted[1], v21primary=voted[2], v22general=voted[3], v23town=voted[4],
+        voter_score=score,
+    )
+
+
+class VoterFilterTests(TestCase):
+    ''' The list and graph views share the same filters '''
+
+    def setUp(self):
+        make_voter('Ann', party='D', born=date(1970, 1, 1))
+        make_voter('Bob', party='R', born=date(1990, 1, 1))
+        make_voter('Cat', party='D', born=date(1995, 1, 1), score=4)
+        make_voter('Dan', party='D', born=date(1992, 1, 1), voted=(False,) * 5)
+
+    def params(self, **extra):
+        return {'voted_in_v20state': 'on', 'voted_in_v23town': 'on', **extra}
+
+    def test_list_and_graphs_filter_alike(self):
+        params = self.params(min_date_of_birth='1980', max_date_of_birth='1994')
+        for name in ('voters', 'graphs'):
+            response = self.client.get(reverse(name), params)
+            self.assertEqual(sorted(v.first_name for v in response.context['voters']), ['Bob'])
+
+    def test_unchecked_elections_mean_did_not_vote(self):
+        response = self.client.get(reverse('voters'), {'voter_score': '2'})
+        self.assertEqual([v.first_name for v in response.context['voters']], ['Dan'])
+        response = self.client.get(reverse('voters'), self.params(voter_score='2'))
+        self.assertEqual([v.first_name for v in response.context['voters']], ['Bob', 'Ann'])
+
+
+class VoterCubeTests(TestCase):
+    ''' The graphs are answered from the precomputed cube '''
+
+    def setUp(self):
+        make_voter('Ann', party='D', born=date(1970, 1, 1))
+        make_voter('Bob', party='R', born=date(1990, 6, 1))
+        make_voter('Cat', party='D', born=date(1990, 1, 1), score=4)
+        make_voter('Dan', party='D', born=date(1992, 1, 1), voted=(False, True, True, True, False))
+        rebuild_voter_cube()
+
+    def test_cube_sums_match_voter_queries(self):
+        for params in [
+            {},
+            {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'},
+            {'voted_in_v20state': 'on', 'voted_in_v23town': 'on', 'min_date_of_birth': '1990', 'voter_score': '2'},
+            {'voted_in_v21town': 'on', 'voted_in_v21primary': 'on', 'voted_in_v22general': 'on', 'max_date_of_birth': '1991'},
+        ]:
+            voters, form = filter_voters(Voter.objects.all(), params)
+            by_year, by_party, by_election = cube_totals(filter_cube(form))
+            self.assertEqual(sum(by_year.values()), voters.count())
+            self.assertEqual(by_election['v21town'], voters.filter(v21town=True).count())
+
+    def test_graphs_do_not_scan_voters(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('graphs'), {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'voter_analytics_voter"' in q['sql']])
+
+
+@skipUnless(np, "numpy is not installed")
+class VoterSnapshotTests(TestCase):
+    ''' The NumPy column store answers filters like the database '''
+
+    def setUp(self):
+        cache.clear()
+        make_voter('Ann', party='D', born=date(1970, 1, 1))
+        make_voter('Bob', party='R', born=date(1990, 6, 1))
+        make_voter('Cat', party='D', born=date(1990, 1, 1), score=4)
+        make_voter('Dan', party='D', born=date(1992, 1, 1), voted=(False, True, True, True, False))
+        make_voter('Eve', party='R', born=date(1990, 1, 1))
+        rebuild_voter_cube()
+
+    def test_masks_match_voter_queries(self):
+        snapshot = get_snapshot()
+        for params in [
+            {},
+            {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'},
+            {'voted_in_v20state': 'on', 'voted_in_v23town': 'on', 'party_affiliation': 'R'},
+            {'voted_in_v20state': 'on', 'voted_in_v23town': 'on', 'min_date_of_birth': '1990', 'voter_score': '2'},
+            {'voted_in_v21town': 'on', 'voted_in_v21primary': 'on', 'voted_in_v22general': 'on', 'max_date_of_birth': '1992'},
+        ]:
+            voters, form = filter_voters(Voter.objects.order_by('-date_of_birth', '-id'), params)
+            mask = snapshot.mask(form.cleaned_data)
+            self.assertEqual(snapshot.count(mask), voters.count())
+            self.assertEqual(snapshot.page_ids(mask, 0, 2), list(voters.values_list('id', flat=True)[:2]))
+            self.assertEqual(snapshot.totals(mask), cube_totals(filter_cube(form)))
+
+    def test_list_view_pages_from_snapshot(self):
+        with override_settings(VOTER_COLUMNAR_SNAPSHOT=True):
+            response = self.client.get(reverse('voters'), {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['paginator'].count, 4)
+        self.assertEqual([v.first_name for v in response.context['voters']], ['Bob', 'Eve', 'Cat', 'Ann'])
+
+    def test_reload_refreshes_snapshot(self):
+        self.assertEqual(len(get_snapshot()), 5)
+        # Single voter edits move the data version too
+        make_voter('Fay')
+        self.assertEqual(len(get_snapshot()), 6)
+
+    def test_load_in_another_process_refreshes_snapshot(self):
+        snapshot = get_snapshot()
+        # What a replacing load committed by another process leaves behind: new rows and a new version
+        new = Voter.objects.bulk_create([Voter(**{**model_to_dict(voter, exclude=['id']), 'first_name': f"New {voter.first_name}"})
+                                         for voter in Voter.objects.all()])
+        Voter.objects.exclude(id__in=[voter.pk for voter in new])._raw_delete(connection.alias)
+        VoterDataVersion.objects.update(version=F('version') + 1)
+
+        self.assertIsNot(get_snapshot(), snapshot)
+        with override_settings(VOTER_COLUMNAR_SNAPSHOT=True):
+            response = self.client.get(reverse('voters'), {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'})
+        self.assertEqual([v.first_name for v in response.context['voters']], ['New Bob', 'New Eve', 'New Cat', 'New Ann'])
+
+
+class VoterExportTests(TestCase):
+    ''' Filtered voters can be exported in full, streamed '''
+
+    def setUp(self):
+        make_voter('Ann', party='D', born=date(1970, 1, 1))
+        make_voter('Bob', party='R', born=date(1990, 6, 1))
+        make_voter('Dan', party='D', born=date(1992, 1, 1), voted=(False, True, True, True, False))
+        rebuild_voter_cube()
+        self.params = {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'}
+
+    def test_csv_is_streamed_in_list_order(self):
+        with self.settings(VOTER_EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(reverse('export_voters'), self.params)
+            self.assertTrue(response.streaming)
+            rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual([row['first_name'] for row in rows], ['Bob', 'Ann'])
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        self.assertEqual((rows[0]['date_of_birth'], rows[0]['v20state'], rows[0]['v21town']), ('1990-06-01', 'True', 'False'))
+
+    def test_count_preflight(self):
+        response = self.client.get(reverse('export_voters_count'), {**self.params, 'party_affiliation': 'D'})
+        self.assertEqual(response.json()['count'], 1)
+        self.assertIn('csv', response.json()['formats'])
+
+    def test_bad_requests_are_refused(self):
+        self.assertEqual(self.client.get(reverse('export_voters'), {'format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_voters'), {'voter_score': '99'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_voters_count'), {'voter_score': '99'}).status_code, 400)
+
+    @skipUnless(pq, "pyarrow is not installed")
+    def test_parquet(self):
+        with self.settings(VOTER_EXPORT_CHUNK_SIZE=1):
+            response = self.client.get(reverse('export_voters'), {**self.params, 'format': 'parquet'})
+            table = pq.read_table(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('first_name').to_pylist(), ['Bob', 'Ann'])
+        self.assertEqual(table.column('date_of_birth').to_pylist(), [date(1990, 6, 1), date(1970, 1, 1)])
+
+
+class VoterPaginationTests(TestCase):
+    ''' The voter list counts from the cube and pages by keyset cursors '''
+
+    def setUp(self):
+        for n, born in enumerate([date(1990, 1, 1), date(1990, 1, 1), date(1985, 3, 1), date(1970, 1, 1), date(1960, 1, 1)]):
+            make_voter(f"V{n}", born=born)
+        make_voter('Other', voted=(False, False, False, False, False))
+        self.params = {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'}
+
+    def paginator(self, object_list=None):
+        voters, form = filter_voters(Voter.objects.order_by('-date_of_birth', '-id'), self.params)
+        return VoterPaginator(voters if object_list is None else object_list, 2, form=form)
+
+    def walk(self, paginator):
+        ''' Names on each page going forward to the end, then back to the start '''
+        pages = [paginator.keyset_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.keyset_page(after=pages[-1].next_cursor))
+        forward = [[v.first_name for v in page] for page in pages]
+        back = [forward[-1]]
+        page = pages[-1]
+        while page.has_previous():
+            page = paginator.keyset_page(before=page.previous_cursor)
+            back.append([v.first_name for v in page])
+        return forward, back
+
+    def test_cube_is_maintained_by_voter_edits(self):
+        voter = Voter.objects.get(first_name='V2')
+        voter.party_affiliation = 'R'
+        voter.save()
+        Voter.objects.get(first_name='V4').delete()
+        maintained = sorted(VoterCube.objects.values_list('birth_year', 'party_affiliation', 'voter_score', 'elections', 'count'))
+        rebuild_voter_cube()
+        self.assertEqual(maintained, sorted(VoterCube.objects.values_list('birth_year', 'party_affiliation', 'voter_score', 'elections', 'count')))
+
+    def test_count_comes_from_cube(self):
+        paginator = self.paginator()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 5)
+        self.assertFalse([q for q in queries.captured_queries if 'voter_analytics_voter"' in q['sql']])
+
+    def test_capped_count_without_cube(self):
+        VoterCube.objects.all().delete()
+        paginator = self.paginator()
+        paginator.count_cap = 3
+        self.assertEqual(paginator.count, 4)
+        self.assertTrue(paginator.is_capped)
+
+    def test_keyset_pages(self):
+        forward, back = self.walk(self.paginator())
+        self.assertEqual(forward, [['V1', 'V0'], ['V2', 'V3'], ['V4']])
+        self.assertEqual(back, [['V4'], ['V2', 'V3'], ['V1', 'V0']])
+
+    @skipUnless(np, "numpy is not installed")
+    def test_keyset_pages_from_snapshot(self):
+        _, form = filter_voters(Voter.objects.none(), self.params)
+        snapshot = get_snapshot()
+        self.assertEqual(self.walk(self.paginator(SnapshotResults(snapshot, snapshot.mask(form.cleaned_data)))),
+                         self.walk(self.paginator()))
+
+    def test_list_links_keep_filters(self):
+        with self.settings(VOTER_PAGE_SIZE=2):
+            response = self.client.get(reverse('voters'), {**self.params, 'party_affiliation': 'D'})
+            self.assertContains(response, "2 of 5 voters")
+            next_cursor = response.context['page_obj'].next_cursor
+            self.assertContains(response, f"?voted_in_v20state=on&amp;voted_in_v23town=on&amp;party_affiliation=D&after={next_cursor}")
+            response = self.client.get(reverse('voters'), {**self.params, 'party_affiliation': 'D', 'after': next_cursor})
+            self.assertEqual([v.first_name for v in response.context['voters']], ['V2', 'V3'])
+        self.assertEqual(self.client.get(reverse('voters'), {'after': '!!'}).status_code, 400)
+
+
+class PartyChoicesTests(TestCase):
+    ''' Party choices are loaded on first use and refreshed by each load '''
+
+    def setUp(self):
+        cache.clear()
+
+    def test_choices_are_cached_until_the_next_load(self):
+        make_voter('Ann', party='D')
+        rebuild_voter_cube()
+        self.assertEqual(list(VoterFilterForm().fields['party_affiliation'].choices), [('', 'All'), ('D', 'D')])
+        # Only the data version is read
+        with self.assertNumQueries(1):
+            list(VoterFilterForm().fields['party_affiliation'].choices)
+
+        make_voter('Bob', party='R')
+        rebuild_voter_cube()
+        self.assertEqual([value for value, _ in VoterFilterForm().fields['party_affiliation'].choices], ['', 'D', 'R'])
+
+    def test_site_imports_without_queries(self):
+        self.assertEqual(find_import_queries(), [])
+
+
+class VoterChartTests(TestCase):
+    ''' The graphs page embeds figure JSON, cached per filter and data version '''
+
+    def setUp(self):
+        cache.clear()
+        make_voter('Ann', party='D', born=date(1970, 1, 1))
+        rebuild_voter_cube()
+        self.params = {'voted_in_v20state': 'on', 'voted_in_v23town': 'on'}
+
+    def test_charts_are_cached_until_the_next_load(self):
+        response = self.client.get(reverse('graphs'), self.params)
+        self.assertContains(response, 'plotly/plotly.min.js')
+        self.assertLess(len(response.content), 100_000)
+
+        # The same filter written differently is served from the cache without touching the cube
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('graphs'), {**self.params, 'voter_score': ''})
+        self.assertFalse([q for q in queries.captured_queries if 'votercube' in q['sql']])
+
+        make_voter('Bob', party='R', born=date(1990, 1, 1))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('graphs'), self.params)
+        self.assertTrue([q for q in queries.captured_queries if 'votercube' in q['sql']])
+        self.assertContains(response, '"R"')
+
+    def test_load_in_another_process_is_seen(self):
+        self.client.get(reverse('graphs'), self.params)
+        # What a load committed by another process leaves behind: new rows and a new version, and no local cache calls
+        Voter.objects.update(party_affiliation='R')
+        VoterCube.objects.update(party_affiliation='R')
+        VoterDataVersion.objects.update(version=F('version') + 1)
+        self.assertContains(self.client.get(reverse('graphs'), self.params), '"R"')
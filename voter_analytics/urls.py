@@ -5,7 +5,7 @@ from django.urls import path
 from . import views
 
 from django.urls import path
-from .views import VoterDetailView, VoterGraphsView, VoterListView
+from .views import VoterDetailView, VoterExportCountView, VoterExportView, VoterGraphsView, VoterListView
 
 urlpatterns = [
     # /voter_analytics/ base URL pattern renders ListView
@@ -14,4 +14,7 @@ urlpatterns = [
     path('voter/<int:pk>', VoterDetailView.as_view(), name='voter'),
     # /voter_analytics/graphs/ renders Graphs from the models
     path('graphs/', VoterGraphsView.as_view(), name='graphs'),
+    # /voter_analytics/export streams the filtered voters; export/count says how many there are
+    path('export', VoterExportView.as_view(), name='export_voters'),
+    path('export/count', VoterExportCountView.as_view(), name='export_voters_count'),
 ]
\ No newline at end of file